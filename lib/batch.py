@@ -0,0 +1,539 @@
+'''
+Convert many documents, or a whole notebook folder, on a process pool.
+
+Pages are converted in worker processes and handed back in the order of
+the sorted file list, a bounded number at a time, so writing the results
+overlaps conversion and never holds the whole export in memory.
+
+The results go to an output folder, or straight into a zip or tar
+archive, or to stdout as a tar stream.
+'''
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import os
+import sys
+import time
+import queue
+import tarfile
+import zipfile
+from collections import deque
+from multiprocessing import Pool
+from lib import tools
+from lib.journal import Journal, fileDigest
+from lib.report import countElements
+
+
+# Number of pages in flight per worker, bounds the memory of the results
+# waiting to be written
+PENDING_PER_WORKER = 8
+
+# Pages smaller than this go to the workers in chunks of about this many
+# bytes, when their order does not matter, so that each small page does
+# not cost a task of its own
+CHUNK_BYTES = 256*1024
+# and at most this many pages to a chunk
+CHUNK_PAGES = 64
+
+# Batches smaller than this in total are converted in this process, a
+# pool would cost more to start than it saves
+SERIAL_BYTES = 256*1024
+
+TAR_MODES={'.tar': 'w', '.tar.gz': 'w:gz', '.tgz': 'w:gz',
+        '.tar.bz2': 'w:bz2', '.tar.xz': 'w:xz'}
+
+_worker_converter = None
+
+
+def _initWorker(converter):
+    global _worker_converter
+    # pages are spread over the pool already, workers can not start
+    # pools of their own
+    converter.workers = 1
+    _worker_converter = converter
+
+def convertPage(converter, path, counts=False):
+    '''Convert one page file
+
+    <converter>: Markdown2Zim or Zim2Markdown obj.
+    <path>: str, path to the page file.
+    <counts>: bool, count links, lists, etc. of the page, see
+              lib/report.py.
+
+    Return <result>: str, converted text, or the page as it is if the
+                     conversion ran out of the converter's time budget,
+                     or None if it failed.
+           <record>: dict, metrics of the page: file, bytes_in, mtime,
+                     sha1, read_time, convert_time and timed_out, plus the
+                     counts if asked for. A page that could not be read
+                     or converted has an error instead, e.g.
+                     "KeyError: 'x'", so that one bad page does not stop
+                     a batch.
+    '''
+
+    record={'file': path}
+    try:
+        t0=time.perf_counter()
+        mtime=os.path.getmtime(path)
+        with io.open(path, 'rb') as fin:
+            data=fin.read()
+        record.update({'bytes_in': len(data), 'mtime': mtime,
+            'sha1': fileDigest(data)})
+        text=data.decode('utf-8')
+        t1=time.perf_counter()
+        result=converter.convert(text, path)
+        t2=time.perf_counter()
+    except Exception as e:
+        record['error']='%s: %s' %(type(e).__name__, e)
+        return None, record
+
+    record.update({'read_time': t1-t0, 'convert_time': t2-t1,
+        'timed_out': converter.timed_out})
+    if counts:
+        record.update(countElements(text, converter.source_syntax))
+
+    return result, record
+
+def _convertPageTask(args):
+    return convertPage(_worker_converter, *args)
+
+def _convertChunkTask(args):
+    chunk,counts=args
+    return [(pp,)+convertPage(_worker_converter, pp, counts) for pp in chunk]
+
+def _convertTask(item):
+    text,file=item
+    return _worker_converter.convert(text, file)
+
+def _residentMemory():
+    # resident memory of this process in bytes: current on Linux, the
+    # peak elsewhere
+    try:
+        with io.open('/proc/self/statm', 'rb') as fin:
+            return int(fin.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak if sys.platform=='darwin' else peak*1024
+
+def _measuredTask(func, item):
+    return func(item), _residentMemory()
+
+
+class _Task(object):
+    # result of a task on a WorkerPool
+    def __init__(self, pool, generation, result):
+        self.pool=pool
+        self.generation=generation
+        self.result=result
+
+    def get(self):
+        value,rss=self.result.get()
+        self.pool._checkMemory(self.generation, rss)
+        return value
+
+
+class _Ready(object):
+    # outcome of a task, handed over by a callback
+    def __init__(self, value, error=None):
+        self.value=value
+        self.error=error
+
+    def get(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class WorkerPool(object):
+    '''Process pool of converters, with workers recycled
+
+    <converter>: Markdown2Zim or Zim2Markdown obj, each worker gets a copy.
+    <workers>: int, number of worker processes.
+    <max_tasks>: int, a worker is replaced by a fresh one after this many
+                 tasks, or None to keep it.
+    <max_rss>: int, in bytes. Once a worker holds more memory than this
+               after a task, e.g. from a huge page, the pool moves on to
+               new workers. The old ones finish the tasks queued to them,
+               then exit, so no work is lost.
+
+    Use as a context manager. apply_async() is that of
+    multiprocessing.Pool, or puts the task on the <done> queue once its
+    result is in.
+    '''
+
+    def __init__(self, converter, workers, max_tasks=None, max_rss=None):
+        self.converter=converter
+        self.workers=workers
+        self.max_tasks=max_tasks
+        self.max_rss=max_rss
+        self.recycled=0
+        self._generation=0
+        self._retired=[]
+        self._pool=self._newPool()
+
+    def _newPool(self):
+        return Pool(self.workers, _initWorker, (self.converter,),
+                self.max_tasks)
+
+    def apply_async(self, func, args, done=None):
+        item,=args
+        generation=self._generation
+        if done is None:
+            return _Task(self, generation,
+                    self._pool.apply_async(_measuredTask, (func, item)))
+
+        def callback(value):
+            done.put(_Task(self, generation, _Ready(value)))
+        def error_callback(error):
+            done.put(_Task(self, generation, _Ready(None, error)))
+        self._pool.apply_async(_measuredTask, (func, item), callback=callback,
+                error_callback=error_callback)
+
+    def _checkMemory(self, generation, rss):
+        if not self.max_rss or rss<=self.max_rss or\
+                generation!=self._generation:
+            return
+        self._pool.close()
+        self._retired.append(self._pool)
+        self._pool=self._newPool()
+        self._generation+=1
+        self.recycled+=1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pools=self._retired+[self._pool]
+        for pp in pools:
+            if exc_info[0] is None:
+                pp.close()
+            else:
+                pp.terminate()
+        for pp in pools:
+            pp.join()
+
+
+def _imapOrdered(pool, func, items, window):
+    # like pool.imap(), but reads <items> only as results are taken, so
+    # neither the inputs nor the results pile up in memory
+    pending=deque()
+    for item in items:
+        if len(pending)>=window:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(func, (item,)))
+    while pending:
+        yield pending.popleft().get()
+
+def _imapUnordered(pool, func, items, window):
+    # like pool.imap_unordered(), but reads <items> only as results are
+    # taken
+    done=queue.Queue()
+    pending=0
+    for item in items:
+        if pending>=window:
+            yield done.get().get()
+            pending-=1
+        pool.apply_async(func, (item,), done)
+        pending+=1
+    while pending:
+        yield done.get().get()
+        pending-=1
+
+def _fileSize(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        # reported when the page is converted
+        return 0
+
+def sizeChunks(paths, sizes, max_pages=None):
+    '''Group page files into tasks, the largest pages first
+
+    <paths>: list of str, page files.
+    <sizes>: list of int, their sizes in bytes.
+    <max_pages>: int, most pages to a chunk, default to CHUNK_PAGES.
+
+    Return <chunks>: list of lists of paths, a page of CHUNK_BYTES or more
+        alone, smaller ones together up to CHUNK_BYTES or <max_pages>. A
+        pool working through them in order does not end on one core
+        grinding the largest page while the others idle.
+    '''
+
+    if max_pages is None:
+        max_pages=CHUNK_PAGES
+    chunks=[]
+    chunk=[]
+    total=0
+    for size,pp in sorted(zip(sizes, paths), key=lambda x: -x[0]):
+        if size>=CHUNK_BYTES:
+            chunks.append([pp])
+            continue
+        chunk.append(pp)
+        total+=size
+        if total>=CHUNK_BYTES or len(chunk)>=max_pages:
+            chunks.append(chunk)
+            chunk=[]
+            total=0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+
+#-------------Convert texts in order, on a process pool-------------
+def convertMany(converter, items, workers=1):
+    '''Yield the converted text of each item, in input order
+
+    <converter>: Markdown2Zim or Zim2Markdown obj.
+    <items>: iterable of (text, file) tuples, <file> being the path the
+             text comes from, or None.
+    <workers>: int, number of worker processes. Each gets a copy of
+               <converter> once, and converts whole items.
+
+    At most PENDING_PER_WORKER*workers items are in flight at any time.
+    '''
+
+    if workers<=1:
+        for text,file in items:
+            yield converter.convert(text, file)
+        return
+
+    with WorkerPool(converter, workers) as pool:
+        for result in _imapOrdered(pool, _convertTask, items,
+                PENDING_PER_WORKER*workers):
+            yield result
+
+def convertPages(converter, paths, workers=1, counts=False, max_tasks=None,
+        max_rss=None, ordered=True):
+    '''Yield (path, result, record) of each page
+
+    <converter>: Markdown2Zim or Zim2Markdown obj.
+    <paths>: list of str, page files.
+    <workers>: int, number of worker processes. Batches of less than
+               SERIAL_BYTES are converted in this process.
+    <counts>: bool, count links, lists, etc. of the pages.
+    <max_tasks>, <max_rss>: recycling of the workers, see WorkerPool.
+    <ordered>: bool, yield the pages in the order of <paths>. Otherwise
+               they are sent to the workers largest first, small ones in
+               chunks (see sizeChunks()), and yielded as they are done.
+               With <max_tasks> or <max_rss>, each page is a task of its
+               own, so that workers are recycled after that many pages,
+               and their memory checked after every page.
+
+    At most PENDING_PER_WORKER*workers results, or chunks of results, are
+    held at any time. A page that failed has a None result, see
+    convertPage().
+    '''
+
+    if workers>1 and len(paths)>1:
+        sizes=[_fileSize(pp) for pp in paths]
+        if sum(sizes)<SERIAL_BYTES:
+            workers=1
+
+    if workers<=1 or len(paths)<2:
+        for pp in paths:
+            result,record=convertPage(converter, pp, counts)
+            yield pp, result, record
+        return
+
+    window=PENDING_PER_WORKER*workers
+    with WorkerPool(converter, workers, max_tasks, max_rss) as pool:
+        if ordered:
+            results=_imapOrdered(pool, _convertPageTask,
+                    ((pp, counts) for pp in paths), window)
+            for pp,(result,record) in zip(paths, results):
+                yield pp, result, record
+        else:
+            # the pool counts tasks and checks memory after each, not pages
+            max_pages=1 if max_tasks or max_rss else None
+            chunks=sizeChunks(paths, sizes, max_pages)
+            for results in _imapUnordered(pool, _convertChunkTask,
+                    ((cc, counts) for cc in chunks), window):
+                for pp,result,record in results:
+                    yield pp, result, record
+
+
+
+#-------------------Writers of the converted pages-------------------
+class FolderWriter(object):
+    '''Save pages as files under a folder'''
+
+    def __init__(self, folder):
+        self.folder=folder
+
+    def write(self, name, text, mtime=None):
+        abpath_out=os.path.join(self.folder, name)
+        folder=os.path.dirname(abpath_out)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        with io.open(abpath_out, 'w', encoding='utf-8') as fout:
+            fout.write(text)
+
+    def close(self):
+        pass
+
+
+class ZipWriter(object):
+    '''Stream pages into a zip archive'''
+
+    def __init__(self, fileout):
+        self.archive=zipfile.ZipFile(fileout, 'w', zipfile.ZIP_DEFLATED)
+
+    def write(self, name, text, mtime=None):
+        date=time.localtime(mtime or 315532800)[:6]
+        info=zipfile.ZipInfo(name.replace(os.sep, '/'), max(date,
+            (1980,1,1,0,0,0)))
+        info.compress_type=zipfile.ZIP_DEFLATED
+        info.external_attr=0o644<<16
+        self.archive.writestr(info, text.encode('utf-8'))
+
+    def close(self):
+        self.archive.close()
+
+
+class TarWriter(object):
+    '''Stream pages into a tar archive, or to a stream as a tar stream'''
+
+    def __init__(self, fileout=None, mode='w', fileobj=None):
+        if fileobj is not None:
+            # a pipe can not seek, write in stream mode
+            mode=mode.replace(':', '|') if ':' in mode else 'w|'
+        self.archive=tarfile.open(fileout, mode, fileobj=fileobj)
+
+    def write(self, name, text, mtime=None):
+        data=text.encode('utf-8')
+        info=tarfile.TarInfo(name.replace(os.sep, '/'))
+        info.size=len(data)
+        info.mtime=int(mtime or 0)
+        info.mode=0o644
+        self.archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.archive.close()
+
+
+def archiveMode(fileout):
+    '''Archive type of an output path: 'zip', a tar mode, or None'''
+
+    name=fileout.lower()
+    if name.endswith('.zip'):
+        return 'zip'
+    for ext in sorted(TAR_MODES, key=len, reverse=True):
+        if name.endswith(ext):
+            return TAR_MODES[ext]
+    return None
+
+def openWriter(fileout):
+    '''Open a writer for <fileout>
+
+    <fileout>: str, '-' for a tar stream to stdout, a .zip, .tar, .tar.gz,
+               .tgz, .tar.bz2 or .tar.xz file for an archive, or else a
+               folder.
+    '''
+
+    if fileout=='-':
+        stream=getattr(sys.stdout, 'buffer', sys.stdout)
+        return TarWriter(fileobj=stream)
+
+    fileout=tools.expandUser(fileout)
+    mode=archiveMode(fileout)
+    if mode=='zip':
+        return ZipWriter(fileout)
+    if mode is not None:
+        return TarWriter(fileout, mode)
+    return FolderWriter(fileout)
+
+
+
+#-------------------Convert a notebook folder-------------------
+def convertFolder(converter, folder, fileout, ext_in, ext_out, workers=1,
+        verbose=True, report=None, resume=False, max_tasks=None,
+        max_rss=None):
+    '''Convert all pages under a folder
+
+    <converter>: Markdown2Zim or Zim2Markdown obj.
+    <folder>: str, input folder.
+    <fileout>: str, output folder, archive file or '-', see openWriter().
+    <ext_in>: str or tuple of str, extension(s) of the input pages.
+    <ext_out>: str, extension of the output pages, e.g. '.md'.
+    <workers>: int, number of worker processes.
+    <report>: Report obj (lib/report.py), gets the metrics record of each page,
+              with the output name, bytes_out and write_time added.
+    <resume>: bool, skip the pages an earlier run into the same output
+              folder has done, and that did not change since, see
+              lib/journal.py. Output to a folder always keeps a journal.
+    <max_tasks>, <max_rss>: recycling of the workers, see WorkerPool.
+
+    Pages that fail to convert are not written, and are listed at the
+    end, and in the report with their error.
+
+    Return <n>: int, number of pages converted.
+    '''
+
+    folder=tools.expandUser(folder)
+    paths=tools.findFiles(folder, ext_in)
+    writer=openWriter(fileout)
+
+    journal=None
+    if isinstance(writer, FolderWriter):
+        journal=Journal(writer.folder, resume)
+    elif resume:
+        raise Exception("\n# <convertFolder>: Can only resume into a folder.")
+
+    if resume:
+        total=len(paths)
+        paths=[pp for pp in paths if not journal.isDone(pp,
+                os.path.relpath(pp, folder))]
+        if verbose:
+            print('\n# <convertFolder>: %d of %d pages done already.'
+                    %(total-len(paths), total))
+
+    if verbose:
+        print('\n# <convertFolder>: Converting %d pages in:' %len(paths))
+        print(folder)
+
+    failed=[]
+    try:
+        # files in a folder can be written in any order
+        for path,text,record in convertPages(converter, paths, workers,
+                report is not None, max_tasks, max_rss,
+                not isinstance(writer, FolderWriter)):
+            if text is None:
+                failed.append(record)
+                if report is not None:
+                    report.add(record)
+                continue
+            rel=os.path.relpath(path, folder)
+            name=os.path.splitext(rel)[0]+ext_out
+            t0=time.perf_counter()
+            writer.write(name, text, record['mtime'])
+            if journal is not None:
+                journal.add(rel, record['bytes_in'], record['mtime'],
+                        record['sha1'], name)
+            if report is not None:
+                record['output']=name
+                record['bytes_out']=len(text.encode('utf-8'))
+                record['write_time']=time.perf_counter()-t0
+                report.add(record)
+    finally:
+        writer.close()
+        if journal is not None:
+            journal.close()
+
+    if failed:
+        print('# <convertFolder>: %d pages failed:' %len(failed),
+                file=sys.stderr)
+        for rr in failed:
+            print('  %s: %s' %(rr['file'], rr['error']), file=sys.stderr)
+    if verbose:
+        print('# <convertFolder>: Results saved to:')
+        print(fileout)
+
+    return len(paths)-len(failed)
+
@@ -0,0 +1,142 @@
+'''
+Export a whole Zim notebook as one Markdown document, e.g. to read it
+offline or to make a PDF of it.
+
+Pages follow in namespace order, each page before the pages under it
+("Work", "Work:Todo", then "Writing"). Each page starts with an anchor,
+and the links that parseLink() resolved to a page of the notebook point
+to that anchor instead of the page file. Headings go one level down per
+namespace level, so "Work:Todo" is a chapter of "Work".
+
+Pages are converted on a process pool and written in order, as they come
+back, a bounded number at a time (see lib/batch.py): the book is never
+held in memory.
+'''
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import os
+import re
+import sys
+from lib import batch
+from lib import tools
+from lib.catalog import pageName
+
+
+# the header block Zim writes at the top of a page
+_zim_header_re = re.compile(r'\AContent-Type:.*\n(?:[\w-]+:.*\n)*\n*')
+_md_heading_re = re.compile(r'^(#{1,6})(?=[ \t])')
+_fence_re = re.compile(r'^[ \t]*```')
+# link to a page file, as written by Zim2Markdown
+_page_link_re = re.compile(r'\]\(([^()\n]+?\.txt)\)')
+_anchor_re = re.compile(r'[^\w-]+')
+
+
+def pageAnchor(name):
+    '''Anchor of a page in the book, e.g. "Work:Todo" -> "work-todo"'''
+
+    return _anchor_re.sub('-', name).strip('-').lower() or 'page'
+
+def bookOrder(paths, root):
+    '''Page files of a notebook in namespace order
+
+    <paths>: list of str, page files under <root>.
+    <root>: str, folder of the notebook.
+    '''
+
+    def key(path):
+        return pageName(path, root).split(':')
+
+    return sorted(paths, key=key)
+
+def shiftHeadings(text, shift):
+    '''Move the headings of a markdown text <shift> levels down, at most
+    to level 6, leaving lines in fenced code alone'''
+
+    if not shift or '#' not in text:
+        return text
+
+    lines=text.split('\n')
+    fence=False
+    for ii,line in enumerate(lines):
+        if _fence_re.match(line):
+            fence=not fence
+        elif not fence and line.startswith('#'):
+            match=_md_heading_re.match(line)
+            if match:
+                level=min(6, len(match.group(1))+shift)
+                lines[ii]='#'*level+line[match.end():]
+    return '\n'.join(lines)
+
+def bookPage(text, path, root):
+    '''Turn the converted text of a page into its part of the book
+
+    <text>: str, markdown converted from the page.
+    <path>: str, the page file.
+    <root>: str, folder of the notebook.
+    '''
+
+    name=pageName(path, root)
+    text=_zim_header_re.sub('', text)
+    text=shiftHeadings(text, name.count(':'))
+
+    def link(match):
+        target=os.path.normpath(match.group(1))
+        if os.path.relpath(target, root).startswith(os.pardir):
+            return match.group()
+        return '](#%s)' %pageAnchor(pageName(target, root))
+
+    text=_page_link_re.sub(link, text)
+
+    return '<a id="%s"></a>\n\n%s\n' %(pageAnchor(name), text.strip('\n'))
+
+
+
+#-------------------Write a notebook as one document-------------------
+def exportBook(converter, folder, fileout, workers=1, verbose=True):
+    '''Convert all pages of a notebook into one markdown file
+
+    <converter>: Zim2Markdown obj.
+    <folder>: str, notebook folder.
+    <fileout>: str, output markdown file, or '-' for stdout.
+    <workers>: int, number of worker processes.
+
+    Return <n>: int, number of pages written.
+    '''
+
+    folder=os.path.normpath(tools.expandUser(folder))
+    paths=bookOrder(tools.findFiles(folder, '.txt'), folder)
+    if verbose:
+        print('\n# <exportBook>: Converting %d pages in:' %len(paths))
+        print(folder)
+
+    if fileout=='-':
+        fout=io.TextIOWrapper(getattr(sys.stdout, 'buffer', sys.stdout),
+                encoding='utf-8')
+    else:
+        fout=io.open(tools.expandUser(fileout), 'w', encoding='utf-8')
+
+    n=0
+    try:
+        for path,text,record in batch.convertPages(converter, paths,
+                workers):
+            if text is None:
+                print('# <exportBook>: Skipped %s: %s' %(path,
+                    record['error']), file=sys.stderr)
+                continue
+            if n:
+                fout.write('\n')
+            fout.write(bookPage(text, path, folder))
+            n+=1
+    finally:
+        if fileout=='-':
+            fout.flush()
+            fout.detach()
+        else:
+            fout.close()
+
+    if verbose:
+        print('# <exportBook>: Book saved to:')
+        print(fileout)
+
+    return n
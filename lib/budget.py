@@ -0,0 +1,64 @@
+'''
+Time budget of a single conversion.
+
+An adversarial document can keep a backtracking regex busy for minutes.
+timeLimit() starts a real-time timer whose SIGALRM raises BudgetExceeded
+in the middle of the conversion: the regex engine checks for signals as
+it runs, so even a regex stuck in backtracking is left. The converter
+then drops the conversion and passes the text through as it is (see
+Converter.convert()).
+
+Signals are only delivered to the main thread, and only on systems with
+setitimer(). Elsewhere, e.g. on the threads of a ConverterPool, the budget
+is not enforced. Batch worker processes run conversions on their main
+thread, so a document over the budget only holds its worker that long.
+'''
+from __future__ import print_function
+from __future__ import unicode_literals
+import time
+import signal
+import threading
+from contextlib import contextmanager
+
+
+
+class BudgetExceeded(Exception):
+    '''A conversion ran longer than its time budget'''
+
+
+def canInterrupt():
+    '''Whether a time budget can be enforced in the calling thread'''
+
+    return hasattr(signal, 'setitimer') and\
+            threading.current_thread() is threading.main_thread()
+
+@contextmanager
+def timeLimit(seconds):
+    '''Raise BudgetExceeded in the with block after <seconds>
+
+    <seconds>: float, time budget, None or 0 for no limit.
+
+    A timer already running, e.g. the budget of an enclosing call, is
+    put back afterwards with the time it has left.
+    '''
+
+    if not seconds or not canInterrupt():
+        yield
+        return
+
+    def handler(signum, frame):
+        raise BudgetExceeded('conversion took more than %gs' %seconds)
+
+    old_handler=signal.signal(signal.SIGALRM, handler)
+    t0=time.perf_counter()
+    old_delay,old_interval=signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, old_handler)
+        if old_delay:
+            left=old_delay-(time.perf_counter()-t0)
+            # an expired outer budget fires right away
+            signal.setitimer(signal.ITIMER_REAL, max(left, 1e-6),
+                    old_interval)
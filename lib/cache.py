@@ -0,0 +1,91 @@
+'''
+Bounded LRU cache for span-level conversion results.
+
+Template-generated notes repeat the same headers, list items and
+signature lines many times. A converter given a SpanCache looks up the
+result of _run_span_gamut() by the span text plus the converter state
+the span stages depend on, and only runs the stages on a miss.
+'''
+from __future__ import print_function
+from __future__ import unicode_literals
+import threading
+from collections import OrderedDict
+
+
+
+class SpanCache(object):
+    '''Bounded LRU cache with hit-rate statistics
+
+    <maxsize>: int, max number of entries kept.
+    <maxlen>: int, spans longer than this many characters are not cached,
+              long paragraphs rarely repeat and would crowd out the
+              short ones.
+    '''
+
+    def __init__(self, maxsize=4096, maxlen=1024):
+        self.maxsize=maxsize
+        self.maxlen=maxlen
+        self.hits=0
+        self.misses=0
+        self._data=OrderedDict()
+        self._lock=threading.Lock()
+
+    def __getstate__(self):
+        # sent to worker processes empty, each worker fills its own copy
+        return {'maxsize': self.maxsize, 'maxlen': self.maxlen}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, state, text, func):
+        '''Get the cached result of func(text), computing it on a miss
+
+        <state>: hashable, converter state the result depends on.
+        <text>: str, span text.
+        <func>: callable, computes the result from <text>.
+        '''
+
+        if len(text)>self.maxlen:
+            return func(text)
+
+        key=(state, text)
+        with self._lock:
+            try:
+                result=self._data[key]
+            except KeyError:
+                pass
+            else:
+                self._data.move_to_end(key)
+                self.hits+=1
+                return result
+
+        result=func(text)
+
+        with self._lock:
+            self.misses+=1
+            self._data[key]=result
+            if len(self._data)>self.maxsize:
+                self._data.popitem(last=False)
+
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits=0
+            self.misses=0
+
+    @property
+    def hit_rate(self):
+        total=self.hits+self.misses
+        return float(self.hits)/total if total else 0.
+
+    def stats(self):
+        '''Return a dict of hits, misses, hit rate and current size'''
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate, 'size': len(self._data),
+                'maxsize': self.maxsize}
+
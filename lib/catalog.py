@@ -0,0 +1,260 @@
+'''
+Catalog of a notebook: title, header fields and heading outline of each
+page, found without converting the pages.
+
+Zim pages are read for their header block (Content-Type, Creation-Date,
+etc.) and their heading lines, Markdown files for their ATX and setext
+headings. Lines inside code and verbatim blocks are skipped. Pages are
+scanned on a process pool and the catalog written as JSON or SQLite.
+'''
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import os
+import re
+import json
+import sqlite3
+from contextlib import closing
+from multiprocessing import Pool
+from lib import tools
+
+
+_zim_header_re = re.compile(r'^([\w-]+):[ \t]*(.*?)\s*$')
+_zim_h_re = re.compile(r'^(={1,6})[ \t]*(.+?)[ \t]*\1[ \t]*$')
+_md_atx_re = re.compile(r'^(#{1,6})[ \t]*(.+?)[ \t]*(?<!\\)#*[ \t]*$')
+_md_setext_re = re.compile(r'^(=+|-+)[ \t]*$')
+
+
+def pageName(path, root):
+    '''Zim page name of a file, e.g. "Notes/Work/Todo.txt" -> "Notes:Work:Todo"
+
+    <path>: str, path to the page file.
+    <root>: str, folder of the notebook, or None to use the base name.
+    '''
+
+    if root is None:
+        rel=os.path.basename(path)
+    else:
+        rel=os.path.relpath(path, root)
+    rel=os.path.splitext(rel)[0]
+    return ':'.join(rel.split(os.sep))
+
+
+
+def _readLines(path):
+    with io.open(path, 'r', encoding='utf-8', errors='replace') as fin:
+        for line in fin:
+            yield line.rstrip('\r\n')
+
+def scanZim(path):
+    '''Read header fields and headings of a Zim page
+
+    <path>: str, path to the page file.
+
+    Return <headers>: dict, the header block, e.g. {'Creation-Date': ...}.
+           <outline>: list of (level, text), level 1 for the biggest
+                      heading, as in the converted Markdown.
+    '''
+
+    headers={}
+    outline=[]
+    in_header=None
+    fence=None
+
+    for line in _readLines(path):
+        if in_header is None:
+            # a page written by Zim starts with its Content-Type
+            in_header=line.startswith('Content-Type:')
+        if in_header:
+            match=_zim_header_re.match(line)
+            if match:
+                headers[match.group(1)]=match.group(2)
+                continue
+            in_header=False
+
+        if fence is not None:
+            if line.rstrip()==fence:
+                fence=None
+            continue
+        if line.startswith("'''") or line.startswith('```'):
+            fence=line[:3]
+            continue
+
+        if line.startswith('='):
+            match=_zim_h_re.match(line)
+            if match:
+                # same levels as Zim2Markdown._h_sub()
+                level=max(1, 6-len(match.group(1)))
+                outline.append((level, match.group(2)))
+
+    return headers, outline
+
+def scanMarkdown(path):
+    '''Read ATX and setext headings of a Markdown file
+
+    <path>: str, path to the markdown file.
+
+    Return <headers>: dict, always empty.
+           <outline>: list of (level, text).
+    '''
+
+    outline=[]
+    fence=False
+    prev=''
+
+    for line in _readLines(path):
+        if line.startswith('```'):
+            fence=not fence
+            prev=''
+            continue
+        if fence:
+            continue
+
+        if line.startswith('#'):
+            match=_md_atx_re.match(line)
+            if match:
+                outline.append((len(match.group(1)), match.group(2)))
+                prev=''
+                continue
+        elif prev.strip() and line[:1] in '=-' and _md_setext_re.match(line):
+            outline.append((1 if line[0]=='=' else 2, prev.strip()))
+            prev=''
+            continue
+        prev=line
+
+    return {}, outline
+
+
+
+SCANNERS={'zim': scanZim, 'markdown': scanMarkdown}
+EXTENSIONS={'zim': '.txt', 'markdown': ('.md', '.markdown')}
+
+def scanPage(args):
+    '''Catalog record of one page
+
+    <args>: tuple of (path, root, syntax), <syntax> being 'zim' or
+            'markdown'.
+
+    Return <record>: dict with keys path, page, title, creation_date,
+                     size, mtime, headers and outline.
+    '''
+
+    path,root,syntax=args
+    headers,outline=SCANNERS[syntax](path)
+    page=pageName(path, root)
+    stat=os.stat(path)
+
+    if outline:
+        title=outline[0][1]
+    else:
+        title=page.split(':')[-1].replace('_', ' ')
+
+    return {'path': path,
+            'page': page,
+            'title': title,
+            'creation_date': headers.get('Creation-Date'),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'headers': headers,
+            'outline': outline}
+
+def scanNotebook(paths, root, syntax, workers=1):
+    '''Yield catalog records of pages, in the order of <paths>
+
+    <paths>: list of str, page files.
+    <root>: str, notebook folder the page names are relative to.
+    <syntax>: str, 'zim' or 'markdown'.
+    <workers>: int, number of processes to scan with.
+    '''
+
+    tasks=[(pp, root, syntax) for pp in paths]
+    if workers<=1 or len(tasks)<2:
+        for tt in tasks:
+            yield scanPage(tt)
+        return
+
+    with closing(Pool(workers)) as pool:
+        for rec in pool.imap(scanPage, tasks, chunksize=32):
+            yield rec
+
+
+
+#-------------------Write catalog records to a file-------------------
+def writeJSON(records, fileout):
+    '''Write records to a JSON file as a list, one record at a time'''
+
+    with io.open(fileout, 'w', encoding='utf-8') as fout:
+        fout.write('[')
+        for ii, rec in enumerate(records):
+            fout.write('\n' if ii==0 else ',\n')
+            fout.write(json.dumps(rec, ensure_ascii=False))
+        fout.write('\n]\n')
+
+def writeSQLite(records, fileout):
+    '''Write records to a SQLite database, with tables pages and headings'''
+
+    if os.path.exists(fileout):
+        os.remove(fileout)
+
+    with closing(sqlite3.connect(fileout)) as db:
+        db.executescript('''
+            CREATE TABLE pages (
+                id INTEGER PRIMARY KEY,
+                path TEXT, page TEXT, title TEXT, creation_date TEXT,
+                size INTEGER, mtime REAL, headers TEXT);
+            CREATE TABLE headings (
+                page_id INTEGER REFERENCES pages(id),
+                position INTEGER, level INTEGER, text TEXT);
+            ''')
+        for rec in records:
+            cur=db.execute('INSERT INTO pages (path, page, title, '
+                'creation_date, size, mtime, headers) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (rec['path'], rec['page'], rec['title'],
+                rec['creation_date'], rec['size'], rec['mtime'],
+                json.dumps(rec['headers'])))
+            db.executemany('INSERT INTO headings VALUES (?, ?, ?, ?)',
+                [(cur.lastrowid, ii, level, text) for ii, (level, text)
+                in enumerate(rec['outline'])])
+        db.execute('CREATE INDEX headings_page ON headings(page_id)')
+        db.commit()
+
+def writeCatalog(records, fileout):
+    '''Write records to <fileout>, SQLite for .db/.sqlite files, else JSON'''
+
+    if os.path.splitext(fileout)[1].lower() in ('.db', '.sqlite',
+            '.sqlite3'):
+        writeSQLite(records, fileout)
+    else:
+        writeJSON(records, fileout)
+
+
+
+
+#-------------------Build the catalog of a notebook-------------------
+def buildCatalog(path_in, fileout, syntax, workers=1, verbose=True):
+    '''Scan a notebook folder, or a single page, and write its catalog
+
+    <path_in>: str, notebook folder or page file.
+    <fileout>: str, output .json, or .db/.sqlite file.
+    <syntax>: str, 'zim' or 'markdown'.
+    <workers>: int, number of processes to scan with.
+    '''
+
+    path_in=tools.expandUser(path_in)
+    if os.path.isdir(path_in):
+        root=path_in
+        paths=tools.findFiles(path_in, EXTENSIONS[syntax])
+    else:
+        root=None
+        paths=[path_in]
+
+    if verbose:
+        print('\n# <catalog>: Scanning %d pages...' %len(paths))
+
+    writeCatalog(scanNotebook(paths, root, syntax, workers),
+            tools.expandUser(fileout))
+
+    if verbose:
+        print('# <catalog>: Catalog saved to:')
+        print(fileout)
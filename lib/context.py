@@ -0,0 +1,88 @@
+'''
+Per-call conversion state, so that one converter can serve many threads.
+
+The converters keep the state of a conversion (link definitions, list
+nesting, footnotes, etc.) in a ConversionContext instead of on the
+instance. Each thread has its own current context, started by the
+converter's reset() at the beginning of every convert(), and the
+converter methods reach it through contextAttribute() properties, e.g.
+self.urls. The instance itself only holds read-only settings.
+'''
+from __future__ import print_function
+from __future__ import unicode_literals
+import threading
+
+
+
+class ConversionContext(object):
+    '''Mutable state of one conversion'''
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+
+
+def contextAttribute(name, doc=None):
+    '''Class attribute reading and writing <name> in the current context
+
+    <name>: str, attribute name in the ConversionContext.
+    '''
+
+    def fget(self):
+        return getattr(self._context, name)
+
+    def fset(self, value):
+        setattr(self._context, name, value)
+
+    return property(fget, fset, doc=doc)
+
+
+
+class ContextMixin(object):
+    '''Keep a ConversionContext per thread
+
+    Subclasses define reset(), which calls _begin() with the initial
+    state of a conversion.
+    '''
+
+    @property
+    def _local(self):
+        try:
+            return self.__dict__['_thread_local']
+        except KeyError:
+            return self.__dict__.setdefault('_thread_local',
+                    threading.local())
+
+    @property
+    def _context(self):
+        try:
+            return self._local.context
+        except AttributeError:
+            # outside of a conversion, e.g. a method called directly
+            self.reset()
+            return self._local.context
+
+    def _begin(self, **values):
+        '''Start a new context for the calling thread'''
+        self._local.context = ConversionContext(**values)
+
+    def _set_context(self, context):
+        '''Make <context> current for the calling thread, e.g. in a worker
+        process running part of a conversion started elsewhere.'''
+        self._local.context = context
+
+    def __getstate__(self):
+        # thread locals can not be pickled, send the context of the
+        # calling thread along instead
+        state = dict(self.__dict__)
+        state.pop('_thread_local', None)
+        state['_pickled_context'] = getattr(self._local, 'context', None)
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        context = state.pop('_pickled_context', None)
+        self.__dict__.update(state)
+        if context is not None:
+            self._set_context(context)
+
@@ -0,0 +1,14 @@
+'''
+Conversion machinery shared by Markdown2Zim and Zim2Markdown.
+
+Both converters are stripped from markdown2.py and share most of its
+block and span scanning: link and footnote definitions, lists, fenced
+code, code spans, paragraphs, plus the escape table and the dedent
+helpers. They live here once, in Converter, and each converter subclass
+only defines the stages that differ between the two directions.
+'''
+from __future__ import unicode_literals
+from lib.core.patterns import LazyPattern
+from lib.core.text import hash_text, g_escape_table, dedent, dedentlines,\
+        xml_escape_attr
+from lib.core.converter import Converter
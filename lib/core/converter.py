@@ -0,0 +1,852 @@
+'''
+Base class of the converters.
+
+Converter holds the parts of markdown2's pipeline the two directions
+have in common. A subclass provides the stages that depend on the
+syntax: headers (_h_re and _h_sub), links (_do_links), emphasis
+(_do_italics_and_bold), block quotes, and the span gamut order in
+_convert_spans.
+'''
+from __future__ import print_function
+from __future__ import unicode_literals
+import re
+from collections import deque
+from lib.cache import SpanCache
+from lib.context import ContextMixin, contextAttribute
+from lib.core.patterns import LazyPattern
+from lib.core.text import hash_text, g_escape_table, dedent
+
+
+
+class Converter(ContextMixin):
+    # State of the conversion running in the calling thread, see
+    # lib/context.py. reset() starts a new one on each convert().
+    urls = contextAttribute('urls')
+    titles = contextAttribute('titles')
+    footnotes = contextAttribute('footnotes')
+    footnote_ids = contextAttribute('footnote_ids')
+    _escape_table = contextAttribute('_escape_table')
+    _span_state = contextAttribute('_span_state')
+    _protected = contextAttribute('_protected')
+    # True when the last convert() ran out of its time budget
+    timed_out = contextAttribute('timed_out')
+
+    # Used to track when we're inside an ordered or unordered list
+    # (see _ProcessListItems() for details):
+    list_level = contextAttribute('list_level')
+
+    _ws_only_line_re = LazyPattern(r"^[ \t]+$", re.M)
+
+    # characters dropped from the input, e.g. {'\ufeff': ''}. Set by
+    # subclasses.
+    _weird_uni_table = {}
+
+    # A line starting with one of these may continue the block before it
+    # even after a blank line, so a document can not be cut there
+    # (see lib/parallel.py). Set by subclasses.
+    _chunk_unsafe_re = None
+    # A paragraph with one of these on any line may go on after a blank
+    # line, so a document can not be cut after it either.
+    _chunk_open_re = None
+
+    # syntax of the input text, 'markdown' or 'zim'
+    source_syntax = None
+
+    def __init__(self, html4tags=False, tab_width=4, workers=1,
+            span_cache=None, time_budget=None):
+        self.tab_width = tab_width
+        # number of processes used to convert a single large document
+        self.workers = workers
+        # seconds a convert() may take before the text is passed through
+        # unconverted, see lib/budget.py
+        self.time_budget = time_budget
+
+        self._outdent_re = re.compile(r'^(\t|[ ]{1,%d})' % tab_width, re.M)
+        # optional LRU cache of span gamut results, a SpanCache or its size
+        if isinstance(span_cache, int):
+            span_cache = SpanCache(span_cache)
+        self.span_cache = span_cache
+
+    def reset(self, file=None):
+        self._begin(urls={}, titles={}, footnotes={}, footnote_ids=[],
+                _escape_table=g_escape_table.copy(), _span_state=None,
+                list_level=0, _last_li_endswith_two_eols=False,
+                _protected={}, timed_out=False)
+
+
+    def convert(self, text, file=None):
+        """Convert the given text.
+
+        <file>: str, path of the file the text comes from.
+
+        With a time budget, a conversion running longer is abandoned and
+        the text returned as it is, with self.timed_out set.
+        """
+        if not self.time_budget:
+            return self._convert(text, file)
+        from lib import budget
+        try:
+            with budget.timeLimit(self.time_budget):
+                return self._convert(text, file)
+        except budget.BudgetExceeded:
+            return self._fallback(text, file)
+
+    def _convert(self, text, file=None):
+        text = self._prepare(text, file)
+
+        if self.workers > 1:
+            # Link and footnote definitions are collected by now, the
+            # rest can be done on independent top-level blocks.
+            from lib import parallel
+            text = parallel.runBlockGamut(self, text, self.workers)
+        else:
+            text = self._run_block_gamut(text)
+
+        return self._unprotect(self._finish(text))
+
+    def _fallback(self, text, file=None):
+        """Result of a conversion abandoned for its time budget."""
+        self.reset(file)
+        self.timed_out = True
+        return text
+
+    def convert_many(self, items, workers=1):
+        """Convert many texts with this one converter.
+
+        <items>: iterable of (text, file) tuples, see convert().
+        <workers>: int, number of processes to spread the items over.
+
+        Return a generator of the converted texts, in input order. Items
+        are read as the results are consumed.
+        """
+        from lib import batch
+        return batch.convertMany(self, items, workers)
+
+    def _prepare(self, text, file=None):
+        """Normalize the text and collect document-wide definitions,
+        returning the text to run the block gamut on."""
+        # Main function. The order in which other subs are called here is
+        # essential. Link and image substitutions need to happen before
+        # _EscapeSpecialChars(), so that any *'s or _'s in the <a>
+        # and <img> tags get encoded.
+
+        # Clear the global hashes. If we don't clear these, you get conflicts
+        # from other articles when generating a page which contains more than
+        # one article (e.g. an index page that shows the N most recent
+        # articles):
+        self.reset(file)
+
+        text = self._normalize(text)
+
+        # Convert all tabs to spaces.
+        #text = self._detab(text)
+
+        text = self._do_fenced_code_blocks(text)
+
+        # Strip link definitions, store in hashes.
+        # Must do footnotes first because an unlucky footnote defn
+        # looks like a link defn:
+        #   [^4]: this "looks like a link defn"
+        text = self._strip_footnote_definitions(text)
+
+        text = self._strip_link_definitions(text)
+
+        # The span stages may depend on document-wide state, e.g. the
+        # link definitions just collected, which goes in the span cache
+        # key.
+        self._span_state = self._get_span_state()
+
+        return text
+
+    def _finish(self, text):
+        """Add the document-wide parts to the converted text."""
+        return text + "\n"
+
+    def _normalize(self, text):
+        """Standardize line endings, drop the weird characters, make sure
+        the text ends with a couple of newlines and strip any lines
+        consisting only of spaces and tabs.
+
+        Stripping these lines makes subsequent regexen easier to write,
+        because we can match consecutive blank lines with /\n+/ instead
+        of something contorted like /[ \t]*\n+/ .
+        """
+        # Most texts need none of it, and the substring checks are much
+        # faster than the passes they save
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        for char, repl in self._weird_uni_table.items():
+            if char in text:
+                text = text.replace(char, repl)
+        if " \n" in text or "\t\n" in text or text.endswith((" ", "\t")):
+            return self._ws_only_line_re.sub("", text + "\n\n")
+        return text + "\n\n"
+
+    def _get_span_state(self):
+        return None
+
+    def _protect(self, block):
+        """Returns a token standing in for a converted block, e.g. a code
+        block, until _unprotect() puts it back at the end. No later stage
+        can change the block, nor has to scan it."""
+        key = hash_text(block)
+        self._protected[key] = block
+        return key
+
+    _protected_re = LazyPattern(r'(^[ \t]*)?(md5-[0-9a-f]{32})', re.M)
+
+    def _unprotect(self, text):
+        protected = self._protected
+        if not protected:
+            return text
+
+        def sub(match):
+            block = protected.get(match.group(2))
+            if block is None:
+                return match.group()
+            if 'md5-' in block:
+                # a later stage took a protected block into another one
+                block = self._unprotect(block)
+            indent = match.group(1)
+            if indent is None:
+                return block
+            # a quote or list indented the token, its lines get the same
+            return indent + block.replace('\n', '\n' + indent)
+
+        return self._protected_re.sub(sub, text)
+
+
+
+    _detab_re = LazyPattern(r'(.*?)\t', re.M)
+    def _detab_sub(self, match):
+        g1 = match.group(1)
+        return g1 + (' ' * (self.tab_width - len(g1) % self.tab_width))
+
+    def _detab(self, text):
+        r"""Remove (leading?) tabs from a file.
+
+            >>> m = Markdown()
+            >>> m._detab("\tfoo")
+            '    foo'
+            >>> m._detab("  \tfoo")
+            '    foo'
+            >>> m._detab("\t  foo")
+            '      foo'
+            >>> m._detab("  foo")
+            '  foo'
+            >>> m._detab("  foo\n\tbar\tblam")
+            '  foo\n    bar blam'
+        """
+        if '\t' not in text:
+            return text
+        return self._detab_re.subn(self._detab_sub, text)[0]
+
+
+
+    def _strip_link_definitions(self, text):
+        # Strips link definitions from text, stores the URLs and titles in
+        # hash references.
+        less_than_tab = self.tab_width - 1
+
+        # Link defs are in the form:
+        #   [id]: url "optional title"
+        _link_def_re = re.compile(r"""
+            ^[ ]{0,%d}\[(.+)\]: # id = \1
+              [ \t]*
+              \n?               # maybe *one* newline
+              [ \t]*
+            <?(.+?)>?           # url = \2
+              [ \t]*
+            (?:
+                \n?             # maybe one newline
+                [ \t]*
+                (?<=\s)         # lookbehind for whitespace
+                ['"(]
+                ([^\n]*)        # title = \3
+                ['")]
+                [ \t]*
+            )?  # title is optional
+            (?:\n+|\Z)
+            """ % less_than_tab, re.X | re.M | re.U)
+        return _link_def_re.sub(self._extract_link_def_sub, text)
+
+    # Ampersand-encoding based entirely on Nat Irons's Amputator MT plugin:
+    #   http://bumppo.net/projects/amputator/
+    _ampersand_re = LazyPattern(r'&(?!#?[xX]?(?:[0-9a-fA-F]+|\w+);)')
+    _naked_lt_re = LazyPattern(r'<(?![a-z/?\$!])', re.I)
+    _naked_gt_re = LazyPattern(r'''(?<![a-z0-9?!/'"-])>''', re.I)
+
+    def _encode_amps_and_angles(self, text):
+        # Smart processing for ampersands and angle brackets that need
+        # to be encoded.
+        text = self._ampersand_re.sub('&amp;', text)
+
+        # Encode naked <'s
+        text = self._naked_lt_re.sub('&lt;', text)
+
+        # Encode naked >'s
+        # Note: Other markdown implementations (e.g. Markdown.pl, PHP
+        # Markdown) don't do this.
+        text = self._naked_gt_re.sub('&gt;', text)
+        return text
+
+
+
+    def _extract_link_def_sub(self, match):
+        id, url, title = match.groups()
+        key = id.lower()    # Link IDs are case-insensitive
+        self.urls[key] = self._encode_amps_and_angles(url)
+        if title:
+            self.titles[key] = title
+        return ""
+
+
+    def _extract_footnote_def_sub(self, match):
+        id, text = match.groups()
+        text = dedent(text, skip_first_line=not text.startswith('\n')).strip()
+        normed_id = re.sub(r'\W', '-', id)
+        # Ensure footnote text ends with a couple newlines (for some
+        # block gamut matches).
+        self.footnotes[normed_id] = text + "\n\n"
+        return ""
+
+    def _strip_footnote_definitions(self, text):
+        """A footnote definition looks like this:
+
+            [^note-id]: Text of the note.
+
+                May include one or more indented paragraphs.
+
+        Where,
+        - The 'note-id' can be pretty much anything, though typically it
+          is the number of the footnote.
+        - The first paragraph may start on the next line, like so:
+
+            [^note-id]:
+                Text of the note.
+        """
+        less_than_tab = self.tab_width - 1
+        footnote_def_re = re.compile(r'''
+            ^[ ]{0,%d}\[\^(.+)\]:   # id = \1
+            [ \t]*
+            (                       # footnote text = \2
+              # First line need not start with the spaces.
+              (?:\s*.*\n+)
+              (?:
+                (?:[ ]{%d} | \t)  # Subsequent lines must be indented.
+                .*\n+
+              )*
+            )
+            # Lookahead for non-space at line-start, or end of doc.
+            (?:(?=^[ ]{0,%d}\S)|\Z)
+            ''' % (less_than_tab, self.tab_width, self.tab_width),
+            re.X | re.M)
+        return footnote_def_re.sub(self._extract_footnote_def_sub, text)
+
+
+    # (mark, stage) pairs, a mark being a string that starts the markup
+    # of the stage: a stage whose marks are all missing from a text has
+    # nothing to do there (see _find_marks()). Set by subclasses, for the
+    # block stages and for the span stages.
+    _block_marks = ()
+    _span_marks = ()
+
+    # a list item marker starting a line
+    _list_mark_re = LazyPattern(r'^[ \t]*(?:[*+-]|\d+\.)[ \t]', re.M)
+
+    def _find_marks(self, text, marks):
+        """Names of the stages of <marks> with something to do in text.
+
+        One substring scan per mark, done once for the text a gamut runs
+        on, so that a paragraph of plain prose skips every stage.
+        """
+        return {stage for mark, stage in marks if mark in text}
+
+    def _run_block_gamut(self, text):
+        # These are all the transformations that form block-level
+        # tags like paragraphs, headers, and list items.
+        marks = self._find_marks(text, self._block_marks)
+
+        if 'fenced' in marks:
+            text = self._do_fenced_code_blocks(text)
+
+        if 'headers' in marks:
+            text = self._do_headers(text)
+
+        # Do Horizontal Rules:
+        # On the number of spaces in horizontal rules: The spec is fuzzy: "If
+        # you wish, you may use spaces between the hyphens or asterisks."
+        # Markdown.pl 1.0.1's hr regexes limit the number of spaces between the
+        # hr chars to one or two. We'll reproduce that limit here.
+
+        # after the headers, a code span in one may have made new lines
+        has_lists = self._list_mark_re.search(text) is not None
+        if has_lists:
+            text = self._do_lists(text)
+
+        if 'headers' in marks or has_lists:
+            # the span gamut of headers and list items may bring in the
+            # marks of a later stage, e.g. with the url of a link
+            marks = self._find_marks(text, self._block_marks)
+
+        text = self._do_code_blocks(text)
+
+        if 'quotes' in marks:
+            text = self._do_block_quotes(text)
+
+        # We already ran _HashHTMLBlocks() before, in Markdown(), but that
+        # was to escape raw HTML in the original Markdown source. This time,
+        # we're escaping the markup we've just created, so that we don't wrap
+        # <p> tags around block-level tags.
+        #text = self._hash_html_blocks(text)
+
+        text = self._form_paragraphs(text)
+
+        return text
+
+    def _run_span_gamut(self, text):
+        if self.span_cache is None:
+            return self._convert_spans(text)
+        return self.span_cache.get(self._span_state, text, self._convert_spans)
+
+
+
+    _inline_link_title = LazyPattern(r'''
+            (                   # \1
+              [ \t]+
+              (['"])            # quote char = \2
+              (?P<title>.*?)
+              \2
+            )?                  # title is optional
+          \)$
+        ''', re.X | re.S)
+    _tail_of_reference_link_re = LazyPattern(r'''
+          # Match tail of: [text][id]
+          [ ]?          # one optional space
+          (?:\n[ ]*)?   # one optional newline followed by spaces
+          \[
+            (?P<id>.*?)
+          \]
+        ''', re.X | re.S)
+
+    _whitespace = LazyPattern(r'\s*')
+
+    _strip_anglebrackets = LazyPattern(r'<(.*)>.*')
+
+    def _find_non_whitespace(self, text, start):
+        """Returns the index of the first non-whitespace character in text
+        after (and including) start
+        """
+        match = self._whitespace.match(text, start)
+        return match.end()
+
+    def _find_balanced(self, text, start, open_c, close_c):
+        """Returns the index where the open_c and close_c characters balance
+        out - the same number of open_c and close_c are encountered - or the
+        end of string if it's reached before the balance point is found.
+        """
+        i = start
+        l = len(text)
+        count = 1
+        while count > 0 and i < l:
+            if text[i] == open_c:
+                count += 1
+            elif text[i] == close_c:
+                count -= 1
+            i += 1
+        return i
+
+    def _extract_url_and_title(self, text, start, brackets=None):
+        """Extracts the url and (optional) title from the tail of a link
+
+        <brackets>: optional index of the matching brackets of <text>, with
+                    a match(pos) method, see markdown2zim._BracketIndex.
+        """
+        # text[start] equals the opening parenthesis
+        idx = self._find_non_whitespace(text, start+1)
+        if idx == len(text):
+            return None, None, None
+        end_idx = idx
+        has_anglebrackets = text[idx] == "<"
+        if has_anglebrackets:
+            end_idx = self._find_balanced(text, end_idx+1, "<", ">")
+            end_idx = self._find_balanced(text, end_idx, "(", ")")
+        else:
+            close = brackets.match(start) if brackets is not None else None
+            if close is None:
+                end_idx = self._find_balanced(text, end_idx, "(", ")")
+            else:
+                end_idx = len(text) if close < 0 else close + 1
+        # The title pattern ends with `\)$`, don't search for it in a
+        # link tail that can't match, e.g. one left unclosed.
+        if not (text.endswith(')', idx, end_idx) or
+                text.endswith(')\n', idx, end_idx)):
+            return None, None, None
+        match = self._inline_link_title.search(text, idx, end_idx)
+        if not match:
+            return None, None, None
+        url, title = text[idx:match.start()], match.group("title")
+        if has_anglebrackets:
+            url = self._strip_anglebrackets.sub(r'\1', url)
+        return url, title, end_idx
+
+
+    def _do_headers(self, text):
+        # Setext-style headers:
+        #     Header 1
+        #     ========
+        #
+        #     Header 2
+        #     --------
+
+        # atx-style headers:
+        #   # Header 1
+        #   ## Header 2
+        #   ## Header 2 with closing hashes ##
+        #   ...
+        #   ###### Header 6
+
+        return self._h_re.sub(self._h_sub, text)
+
+    _marker_ul_chars  = '*+-'
+    _marker_any = r'(?:[%s]|\d+\.)' % _marker_ul_chars
+    _marker_ul = '(?:[%s])' % _marker_ul_chars
+    _marker_ol = r'(?:\d+\.)'
+
+    def _list_sub(self, match):
+        lst = match.group(1)
+        #lst_type = match.group(3) in self._marker_ul_chars and "ul" or "ol"
+        result = self._process_list_items(lst)
+        if self.list_level:
+
+            ########## syntax: list item (ordered) ##############
+            return "\n%s\n" % result
+        else:
+            return "\n%s\n\n" % result
+            ########## syntax: list item (ordered) END ##############
+
+    def _do_lists(self, text):
+        # Form HTML ordered (numbered) and unordered (bulleted) lists.
+
+        # Iterate over each *non-overlapping* list match.
+        pos = 0
+        while True:
+            # Find the *first* hit for either list style (ul or ol). We
+            # match ul and ol separately to avoid adjacent lists of different
+            # types running into each other (see issue #16).
+            hits = []
+            for marker_pat in (self._marker_ul, self._marker_ol):
+                less_than_tab = self.tab_width - 1
+                whole_list = r'''
+                    (                   # \1 = whole list
+                      (                 # \2
+                        [ ]{0,%d}
+                        (%s)            # \3 = first list item marker
+                        [ \t]+
+                        (?!\ *\3\ )     # '- - - ...' isn't a list. See 'not_quite_a_list' test case.
+                      )
+                      (?:.+?)
+                      (                 # \4
+                          \Z
+                        |
+                          \n{2,}
+                          (?=\S)
+                          (?!           # Negative lookahead for another list item marker
+                            [ \t]*
+                            %s[ \t]+
+                          )
+                      )
+                    )
+                ''' % (less_than_tab, marker_pat, marker_pat)
+                if self.list_level:  # sub-list
+                    list_re = re.compile("^"+whole_list, re.X | re.M | re.S)
+                else:
+                    list_re = re.compile(r"(?:(?<=\n\n)|\A\n?)"+whole_list,
+                                         re.X | re.M | re.S)
+                match = list_re.search(text, pos)
+                if match:
+                    hits.append((match.start(), match))
+            if not hits:
+                break
+            hits.sort()
+            match = hits[0][1]
+            start, end = match.span()
+            middle = self._list_sub(match)
+            text = text[:start] + middle + text[end:]
+            pos = start + len(middle) # start pos for next attempted match
+
+        return text
+
+    _list_item_re = LazyPattern(r'''
+        (\n)?                   # leading line = \1
+        (^[ \t]*)               # leading whitespace = \2
+        (?P<marker>%s) [ \t]+   # list marker = \3
+        ((?:.+?)                # list item text = \4
+         (\n{1,2}))             # eols = \5
+        (?= \n* (\Z | \2 (?P<next_marker>%s) [ \t]+))
+        ''' % (_marker_any, _marker_any),
+        re.M | re.X | re.S)
+
+    _last_li_endswith_two_eols = contextAttribute(
+            '_last_li_endswith_two_eols')
+
+    def _list_item_sub(self, match):
+        item = match.group(4)
+        leading_line = match.group(1)
+        if leading_line or "\n\n" in item or self._last_li_endswith_two_eols:
+            item = self._run_block_gamut(self._outdent(item))
+        else:
+            # Recursion for sub-lists:
+            item = self._do_lists(self._outdent(item))
+            if item.endswith('\n'):
+                item = item[:-1]
+            item = self._run_span_gamut(item)
+        self._last_li_endswith_two_eols = (len(match.group(5)) == 2)
+
+        ########## syntax: list item (unordered) ##############
+        bul=match.group(3)
+        if bul in self._marker_ul_chars:
+            bul=u'*'
+        return "%s %s\n" % (bul,item)
+        ########## syntax: list item (unordered) END ##############
+
+
+
+    def _process_list_items(self, list_str):
+        # Process the contents of a single ordered or unordered list,
+        # splitting it into individual list items.
+
+        # The $g_list_level global keeps track of when we're inside a list.
+        # Each time we enter a list, we increment it; when we leave a list,
+        # we decrement. If it's zero, we're not in a list anymore.
+        #
+        # We do this because when we're not inside a list, we want to treat
+        # something like this:
+        #
+        #       I recommend upgrading to version
+        #       8. Oops, now this line is treated
+        #       as a sub-list.
+        #
+        # As a single paragraph, despite the fact that the second line starts
+        # with a digit-period-space sequence.
+        #
+        # Whereas when we're inside a list (or sub-list), that line will be
+        # treated as the start of a sub-list. What a kludge, huh? This is
+        # an aspect of Markdown's syntax that's hard to parse perfectly
+        # without resorting to mind-reading. Perhaps the solution is to
+        # change the syntax rules such that sub-lists must start with a
+        # starting cardinal number; e.g. "1." or "a.".
+        self.list_level += 1
+        self._last_li_endswith_two_eols = False
+        list_str = list_str.rstrip('\n') + '\n'
+        list_str = self._list_item_re.sub(self._list_item_sub, list_str)
+        self.list_level -= 1
+        return list_str
+
+
+
+    def _code_block_sub(self, match, is_fenced_code_block=False):
+        if is_fenced_code_block:
+            lang = match.group(1) or ''
+            codeblock = match.group(2)
+            codeblock = codeblock[:-1]  # drop one trailing newline
+        else:
+            lang = ''
+            codeblock = match.group(1)
+            codeblock = self._outdent(codeblock)
+            codeblock = self._detab(codeblock)
+            codeblock = codeblock.lstrip('\n')  # trim leading newlines
+            codeblock = codeblock.rstrip()      # trim trailing whitespace
+
+        # the code is kept as it is, out of reach of the later stages
+        block = "```%s\n%s\n```" % (lang, codeblock) if codeblock else\
+                "```%s\n```" % lang
+        return "\n\n%s\n\n" % self._protect(block)
+
+
+
+    def _do_code_blocks(self, text):
+        return text
+
+    _fenced_code_block_re = LazyPattern(r'''
+        (?:\n\n|\A\n?)
+        ^```([\w+-]+)?[ \t]*\n      # opening fence, $1 = optional lang
+        (.*?)                       # $2 = code block content
+        ^```[ \t]*\n                # closing fence
+        ''', re.M | re.X | re.S)
+
+    def _fenced_code_block_sub(self, match):
+        return self._code_block_sub(match, is_fenced_code_block=True);
+
+    def _do_fenced_code_blocks(self, text):
+        """Process ```-fenced unindented code blocks ('fenced-code-blocks' extra)."""
+        if '```' not in text:
+            return text
+        return self._fenced_code_block_re.sub(self._fenced_code_block_sub, text)
+
+    # Rules for a code span:
+    # - backslash escapes are not interpreted in a code span
+    # - to include one or or a run of more backticks the delimiters must
+    #   be a longer run of backticks
+    # - cannot start or end a code span with a backtick; pad with a
+    #   space and that space will be removed in the emitted HTML
+    # See `test/tm-cases/escapes.text` for a number of edge-case
+    # examples.
+    _code_span_re = LazyPattern(r'''
+            (?<!\\)
+            (`+)        # \1 = Opening run of `
+            (?!`)       # See Note A test/tm-cases/escapes.text
+            (.+?)       # \2 = The code block
+            (?<!`)
+            \1          # Matching closer
+            (?!`)
+        ''', re.X | re.S)
+
+    _backtick_run_re = LazyPattern(r'`+')
+
+    def _code_span_sub(self, match):
+        c = match.group(2).strip(" \t")
+        #c = self._encode_code(c)
+
+        ########## syntax: code block ##############
+        #return "<code>%s</code>" % c
+        codesym=match.group(1)
+        if codesym=='```':
+            return "%s\n%s\n%s" % (codesym,c,codesym)
+        elif codesym=='`':
+            return "%s%s%s" % (codesym,c,codesym)
+        ########## syntax: code block END ##############
+
+    def _do_code_spans(self, text):
+        #   *   Backtick quotes are used for <code></code> spans.
+        #
+        #   *   You can use multiple backticks as the delimiters if you want to
+        #       include literal backticks in the code span. So, this input:
+        #
+        #         Just type ``foo `bar` baz`` at the prompt.
+        #
+        #       Will translate to:
+        #
+        #         <p>Just type <code>foo `bar` baz</code> at the prompt.</p>
+        #
+        #       There's no arbitrary limit to the number of backticks you
+        #       can use as delimters. If you need three consecutive backticks
+        #       in your code, use four for delimiters, etc.
+        #
+        #   *   You can use spaces to get literal backticks at the edges:
+        #
+        #         ... type `` `bar` `` ...
+        #
+        #       Turns to:
+        #
+        #         ... type <code>`bar`</code> ...
+        if '`' not in text:
+            return text
+
+        # _code_span_re opens a span at a run of backticks, or at the tail
+        # of one, and closes it at the first later run of the same length.
+        # The runs are indexed once, so an opener that is never closed
+        # does not cost a scan to the end of the text.
+        runs = [(m.start(), m.end()) for m in
+                self._backtick_run_re.finditer(text)]
+        later = {}      # run length -> indices of the runs of that length
+        for idx, (start, end) in enumerate(runs):
+            later.setdefault(end - start, deque()).append(idx)
+
+        pieces = []
+        last = 0
+        idx = 0
+        while idx < len(runs):
+            start, end = runs[idx]
+            closer = None
+            for pos in range(start, end):
+                if pos == start and pos and text[pos - 1] == '\\':
+                    continue
+                queue = later.get(end - pos)
+                while queue and queue[0] <= idx:
+                    queue.popleft()
+                if queue:
+                    closer = queue[0]
+                    break
+            if closer is None:
+                idx += 1
+                continue
+            match = self._code_span_re.match(text, pos, runs[closer][1])
+            pieces.append(text[last:pos])
+            pieces.append(self._code_span_sub(match) or '')
+            last = match.end()
+            idx = closer + 1
+        pieces.append(text[last:])
+        return ''.join(pieces)
+
+    def _encode_code(self, text):
+        """Encode/escape certain characters inside Markdown code runs.
+        The point is that in code, these characters are literals,
+        and lose their special Markdown meanings.
+        """
+        replacements = [
+            # Encode all ampersands; HTML entities are not
+            # entities within a Markdown code span.
+            ('&', '&amp;'),
+            # Do the angle bracket song and dance:
+            ('<', '&lt;'),
+            ('>', '&gt;'),
+        ]
+        for before, after in replacements:
+            text = text.replace(before, after)
+        hashed = hash_text(text)
+        self._escape_table[text] = hashed
+        return hashed
+
+    _strong_re = LazyPattern(r"(\*\*|__)(?=\S)(.+?[*_]*)(?<=\S)\1", re.S)
+    _bq_one_level_re = LazyPattern('^[ \t]*>[ \t]?', re.M);
+    _bq_one_level_re_spoiler = LazyPattern('^[ \t]*>[ \t]*?![ \t]?', re.M);
+    _bq_all_lines_spoilers = LazyPattern(r'\A(?:^[ \t]*>[ \t]*?!.*[\n\r]*)+\Z', re.M)
+
+    def _form_paragraphs(self, text):
+        # Strip leading and trailing lines:
+        text = text.strip('\n')
+
+        # Wrap <p> tags.
+        grafs = []
+        for i, graf in enumerate(re.split(r"\n{2,}", text)):
+            graf = self._run_span_gamut(graf)
+            grafs.append(graf.lstrip(" \t"))
+
+        return "\n\n".join(grafs)
+
+
+
+    def _add_footnotes(self, text):
+        if self.footnotes:
+            footer = [
+                '<div class="footnotes">',
+                '<hr />'
+                '<ol>',
+            ]
+            for i, id in enumerate(self.footnote_ids):
+                if i != 0:
+                    footer.append('')
+                footer.append('<li id="fn-%s">' % id)
+                footer.append(self._run_block_gamut(self.footnotes[id]))
+                backlink = ('<a href="#fnref-%s" '
+                    'class="footnoteBackLink" '
+                    'title="Jump back to footnote %d in the text.">'
+                    '&#8617;</a>' % (id, i+1))
+                if footer[-1].endswith("</p>"):
+                    footer[-1] = footer[-1][:-len("</p>")] \
+                        + '&#160;' + backlink + "</p>"
+                else:
+                    footer.append("\n<p>%s</p>" % backlink)
+                footer.append('</li>')
+            footer.append('</ol>')
+            footer.append('</div>')
+            return text + '\n\n' + '\n'.join(footer)
+        else:
+            return text
+
+
+
+    def _outdent(self, text):
+        # Remove one level of line-leading tabs or spaces
+        return text
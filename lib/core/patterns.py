@@ -0,0 +1,38 @@
+'''
+Regexes compiled on first use instead of at import.
+
+The converters define a few dozen verbose class-level regexes, most of
+which a given run never touches (e.g. only the catalog or the stream
+mode is used). LazyPattern compiles one when it is first looked up and
+then replaces itself on the class with the compiled pattern, so later
+lookups cost nothing extra.
+'''
+from __future__ import unicode_literals
+import re
+
+
+
+class LazyPattern(object):
+    '''Class attribute holding a regex compiled on first access
+
+    <pattern>: str, regex pattern.
+    <flags>: int, re flags.
+    '''
+
+    def __init__(self, pattern, flags=0):
+        self.pattern=pattern
+        self.flags=flags
+        self._owner=None
+        self._name=None
+
+    def __set_name__(self, owner, name):
+        self._owner=owner
+        self._name=name
+
+    def __get__(self, obj, owner=None):
+        compiled=re.compile(self.pattern, self.flags)
+        if self._owner is not None:
+            # from now on a plain class attribute
+            setattr(self._owner, self._name, compiled)
+        return compiled
+
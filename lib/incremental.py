@@ -0,0 +1,97 @@
+'''
+Incremental re-conversion of a document that is edited and converted
+again and again, e.g. on each save in an editor.
+
+The document is cut into top-level blocks (see lib/parallel.py) and the
+result of each block is kept, keyed on a hash of its text. On the next
+conversion only new or changed blocks are run through the block gamut,
+plus the blocks that refer to a link definition that has changed. The
+results are spliced together in document order, so the cost follows the
+size of the edit rather than the size of the page.
+'''
+from __future__ import print_function
+from __future__ import unicode_literals
+from hashlib import md5
+from lib import parallel
+
+
+def _hashBlock(text):
+    return md5(text.encode('utf-8')).digest()
+
+def _changedKeys(old, new):
+    return set(kk for kk in set(old) | set(new) if old.get(kk)!=new.get(kk))
+
+
+
+class IncrementalConverter(object):
+    '''Convert successive versions of one document, reusing unchanged blocks
+
+    <converter>: Markdown2Zim or Zim2Markdown obj, used for every version.
+
+    After each convert(), <reused> and <converted> give the number of
+    blocks taken from the previous conversion and run again.
+    '''
+
+    def __init__(self, converter):
+        self.converter=converter
+        self.reused=0
+        self.converted=0
+        self._blocks={}
+        self._urls={}
+        self._titles={}
+        self._file=None
+
+    def reset(self):
+        '''Forget the previous conversion'''
+        self._blocks={}
+
+    def convert(self, text):
+        '''Convert the given text, same as converter.convert(text)'''
+
+        conv=self.converter
+        text=conv._prepare(text)
+
+        # a block referring to [id] has to be redone if id changed
+        changed=_changedKeys(self._urls, conv.urls) |\
+                _changedKeys(self._titles, conv.titles)
+        changed=['[%s]' %kk for kk in changed]
+        if getattr(conv, 'file', None)!=self._file:
+            self._blocks={}
+
+        blocks={}
+        results=[]
+        self.reused=0
+        self.converted=0
+
+        for chunk in parallel.splitDocument(conv, text, 1):
+            key=_hashBlock(chunk)
+            result=blocks.get(key)
+            if result is None:
+                result=self._blocks.get(key)
+                if result is not None and changed:
+                    lowered=chunk.lower()
+                    if any(ii in lowered for ii in changed):
+                        result=None
+                if result is None:
+                    # keep the blocks protected while converting the chunk
+                    # with its result, a later version may reuse both
+                    protected=conv._protected
+                    conv._protected={}
+                    result=(conv._run_block_gamut(chunk), conv._protected)
+                    conv._protected=protected
+                    self.converted+=1
+                else:
+                    self.reused+=1
+                conv._protected.update(result[1])
+                blocks[key]=result
+            else:
+                self.reused+=1
+            results.append(result[0])
+
+        self._blocks=blocks
+        self._urls=dict(conv.urls)
+        self._titles=dict(conv.titles)
+        self._file=getattr(conv, 'file', None)
+
+        return conv._unprotect(conv._finish(parallel.joinBlocks(results)))
+
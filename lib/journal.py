@@ -0,0 +1,99 @@
+'''
+Journal of a batch conversion into a folder, to resume it after a crash.
+
+Every page written to the output folder appends one JSON line to the
+journal: the input file, relative to the input folder, its size,
+modification time and SHA-1, and the output file. Lines are flushed one
+by one, so a run killed at any point leaves the list of the pages it has
+done. A resumed run skips the pages whose input still matches their entry
+and whose output is still there, and converts only the rest.
+'''
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import os
+import json
+import hashlib
+
+
+# file name of the journal in the output folder
+JOURNAL_NAME = '.journal.jsonl'
+
+
+def fileDigest(data):
+    '''SHA-1 hex digest of the bytes of an input file'''
+    return hashlib.sha1(data).hexdigest()
+
+def readJournal(path):
+    '''Last entry of each input file in a journal
+
+    <path>: str, path of the journal.
+
+    Return <entries>: dict, input file -> entry dict. A line cut short by
+                      a crash is skipped.
+    '''
+
+    entries={}
+    with io.open(path, 'r', encoding='utf-8') as fin:
+        for line in fin:
+            try:
+                entry=json.loads(line)
+            except ValueError:
+                continue
+            entries[entry['file']]=entry
+    return entries
+
+
+
+class Journal(object):
+    '''Append-only journal of the pages written to an output folder
+
+    <folder>: str, output folder, the journal is JOURNAL_NAME in it.
+    <resume>: bool, keep the entries of an earlier run and append to
+              them. Otherwise the journal starts empty.
+    '''
+
+    def __init__(self, folder, resume=False):
+        self.folder=folder
+        self.path=os.path.join(folder, JOURNAL_NAME)
+        self.entries={}
+        if resume and os.path.exists(self.path):
+            self.entries=readJournal(self.path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        self._fout=io.open(self.path, 'a' if resume else 'w',
+                encoding='utf-8')
+
+    def isDone(self, path, name):
+        '''Whether an input file is converted already, and unchanged since
+
+        <path>: str, path of the input file.
+        <name>: str, its path relative to the input folder.
+        '''
+
+        entry=self.entries.get(name)
+        if entry is None or not os.path.exists(os.path.join(self.folder,
+                entry['output'])):
+            return False
+        stat=os.stat(path)
+        if stat.st_size!=entry['size']:
+            return False
+        if stat.st_mtime==entry['mtime']:
+            return True
+        # touched, maybe not changed
+        with io.open(path, 'rb') as fin:
+            return fileDigest(fin.read())==entry['sha1']
+
+    def add(self, name, size, mtime, sha1, output):
+        '''Record an input file whose output is written'''
+
+        entry={'file': name, 'size': size, 'mtime': mtime, 'sha1': sha1,
+                'output': output}
+        self.entries[name]=entry
+        self._fout.write(json.dumps(entry, ensure_ascii=False)+'\n')
+        self._fout.flush()
+
+    def close(self):
+        if self._fout is not None:
+            self._fout.close()
+            self._fout=None
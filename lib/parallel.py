@@ -0,0 +1,153 @@
+'''
+Convert a single large document on a process pool.
+
+The document is cut at top-level block boundaries: the start of a line
+that follows a blank line, and that can not continue the block before
+it (a list item, an indented line, a quote marker, etc.) nor sit inside
+a fenced code block. The paragraph before the cut must not hold a list
+item either, e.g. an empty item takes the next paragraph as its text.
+Each chunk then goes through the block gamut on its own and the results
+are stitched back together in order, giving the same output as serial
+conversion.
+'''
+from __future__ import print_function
+from __future__ import unicode_literals
+import re
+from multiprocessing import Pool
+
+
+# Approximate size of a chunk handed to one worker, in characters
+CHUNK_SIZE = 256*1024
+
+# Candidate cut points: the start of a non-blank line after a blank line
+_boundary_re = re.compile(r'\n\n+(?=\S)')
+
+_worker_converter = None
+
+
+def _initWorker(converter, context=None):
+    global _worker_converter
+    _worker_converter = converter
+    if context is not None:
+        # link and footnote definitions collected by the parent
+        converter._set_context(context)
+
+def _convertChunk(chunk):
+    # blocks protected while converting the chunk go back with the result,
+    # the parent puts them back in the end
+    _worker_converter._protected={}
+    result=_worker_converter._run_block_gamut(chunk)
+    return result, _worker_converter._protected
+
+
+
+#-------------Split text at top-level block boundaries-------------
+def splitBlocks(text, unsafe_re, protected=(), chunk_size=CHUNK_SIZE,
+        open_re=None):
+    '''Split text at top-level block boundaries
+
+    <text>: str, text with link and footnote definitions already stripped.
+    <unsafe_re>: compiled regex, a match at a cut point means the line
+                 there may continue the previous block.
+    <protected>: list of (start, end) spans that must not be cut, e.g.
+                 fenced code blocks.
+    <chunk_size>: int, minimal size of a chunk in characters.
+    <open_re>: compiled regex, a match on any line of the paragraph
+               before a cut point means the block there may go on after
+               the blank line, e.g. an open list.
+
+    Return <chunks>: list of str, joining them gives back <text>.
+    '''
+
+    chunks=[]
+    last=0
+    spans=iter(sorted(protected))
+    span=next(spans,None)
+
+    for match in _boundary_re.finditer(text):
+        pos=match.end()
+        if pos-last<chunk_size:
+            continue
+        while span is not None and span[1]<=pos:
+            span=next(spans,None)
+        if span is not None and span[0]<pos:
+            continue
+        if unsafe_re.match(text,pos):
+            continue
+        if open_re is not None:
+            # the paragraph before the blank line
+            start=text.rfind('\n\n', last, match.start())
+            if open_re.search(text, last if start<0 else start+2,
+                    match.start()):
+                continue
+        if not text[last:pos].strip():
+            continue
+        chunks.append(text[last:pos])
+        last=pos
+
+    chunks.append(text[last:])
+
+    return chunks
+
+
+
+#-------------Split a prepared document into top-level blocks-------------
+def splitDocument(converter, text, chunk_size=None):
+    '''Split a prepared document into top-level blocks
+
+    <converter>: Markdown2Zim or Zim2Markdown obj.
+    <text>: str, text returned by converter._prepare().
+    <chunk_size>: int, minimal size of a chunk in characters, default to
+                  CHUNK_SIZE. 1 cuts at every possible boundary.
+
+    Return <chunks>: list of str, each can be run through the block gamut
+                     on its own.
+    '''
+
+    if chunk_size is None:
+        chunk_size=CHUNK_SIZE
+
+    protected=[m.span() for m in
+            converter._fenced_code_block_re.finditer(text)]
+
+    return splitBlocks(text, converter._chunk_unsafe_re, protected,
+            chunk_size, converter._chunk_open_re)
+
+def joinBlocks(results):
+    '''Join block gamut results of the chunks from splitDocument()'''
+
+    # every chunk holds non-blank text, and the block stages end each
+    # block with a blank line, so chunk outputs are whole paragraphs.
+    return '\n\n'.join(results)
+
+
+
+#----------Run the block gamut of a converter on a process pool----------
+def runBlockGamut(converter, text, workers, chunk_size=None):
+    '''Run the block gamut of a converter on a process pool
+
+    <converter>: Markdown2Zim or Zim2Markdown obj, with link and footnote
+                 definitions already collected from <text>.
+    <text>: str, text to convert.
+    <workers>: int, number of worker processes.
+    <chunk_size>: int, minimal size of a chunk in characters, default to
+                  CHUNK_SIZE.
+
+    Return <result>: str, same as converter._run_block_gamut(text).
+    '''
+
+    chunks=splitDocument(converter, text, chunk_size)
+    if len(chunks)<2:
+        return converter._run_block_gamut(text)
+
+    # leaving the block terminates the workers, e.g. when the time budget
+    # of the conversion runs out while they are busy
+    with Pool(min(workers,len(chunks)), _initWorker,
+            (converter, converter._context)) as pool:
+        results=pool.map(_convertChunk, chunks, chunksize=1)
+
+    for result,protected in results:
+        converter._protected.update(protected)
+
+    return joinBlocks([result for result,protected in results])
+
@@ -0,0 +1,60 @@
+'''
+A pool of converters for multi-threaded programs, e.g. a web service.
+
+Converters keep their per-call state in a thread-local conversion context
+(see lib/context.py), so one instance can already be shared by threads.
+The pool hands each thread an idle instance of its own instead, so that
+threads do not contend on a shared span cache. With the GIL, threads
+mostly help when conversions wait on I/O; on a free-threaded CPython
+build they convert in parallel.
+'''
+from __future__ import print_function
+from __future__ import unicode_literals
+import os
+import queue
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+
+
+class ConverterPool(object):
+    '''Converter instances lent to threads
+
+    <factory>: callable, returns a new converter, e.g. Markdown2Zim or
+               functools.partial(Zim2Markdown, span_cache=1024).
+    <size>: int, max number of idle converters kept, default to the
+            number of CPUs.
+    '''
+
+    def __init__(self, factory, size=None):
+        self.factory=factory
+        self.size=size or os.cpu_count() or 1
+        self._idle=queue.LifoQueue()
+
+    @contextmanager
+    def converter(self):
+        '''Borrow a converter for the duration of a with block'''
+
+        try:
+            conv=self._idle.get_nowait()
+        except queue.Empty:
+            conv=self.factory()
+        try:
+            yield conv
+        finally:
+            if self._idle.qsize()<self.size:
+                self._idle.put(conv)
+
+    def convert(self, text, file=None):
+        '''Convert text with a borrowed converter, safe to call from any
+        thread. <file> is passed on to converter.convert().'''
+
+        with self.converter() as conv:
+            return conv.convert(text, file)
+
+    def map(self, texts, threads=None):
+        '''Convert texts on <threads> threads, return results in order'''
+
+        with ThreadPoolExecutor(threads or self.size) as executor:
+            return list(executor.map(self.convert, texts))
+
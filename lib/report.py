@@ -0,0 +1,162 @@
+'''
+Per-file metrics of a batch conversion.
+
+Each converted file gives one JSON record: sizes, read, conversion and
+write times, whether the conversion ran out of its time budget or failed,
+and counts of the links, lists, quotes and code blocks of the source.
+Records are written as JSON lines as the files are done, and the slowest,
+timed out and failed files are kept for a summary at the end, to find the
+inputs that trip up the converters.
+'''
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import re
+import sys
+import json
+import heapq
+
+
+_md_link_re = re.compile(r'\[[^\]\n]*\][ ]?[(\[]|<(?:https?|ftp)://')
+_zim_link_re = re.compile(r'\[\[')
+_list_item_re = re.compile(r'[ \t]*(?:[*+-]|\d+\.)[ \t]')
+
+
+#-------------------Count elements of a source text-------------------
+def countElements(text, syntax):
+    '''Count links, lists, quotes and code blocks of a source text
+
+    <text>: str, markdown or zim text.
+    <syntax>: str, 'markdown' or 'zim'.
+
+    Return <counts>: dict with keys links, lists, quotes and code_blocks.
+        A list is a run of list items, possibly separated by blank or
+        indented lines. Zim has no quotes, its verbatim blocks count as
+        code blocks.
+    '''
+
+    if syntax=='zim':
+        link_re=_zim_link_re
+        fences=("```", "'''")
+        quote='\0'
+    else:
+        link_re=_md_link_re
+        fences=('```',)
+        quote='>'
+
+    links=lists=quotes=code_blocks=0
+    fence=None
+    in_list=in_quote=False
+
+    for line in text.splitlines():
+        if fence is not None:
+            if line.startswith(fence):
+                fence=None
+            continue
+        if line.startswith(fences):
+            fence=line[:3]
+            code_blocks+=1
+            in_list=in_quote=False
+            continue
+
+        if not line.strip():
+            in_quote=False
+            continue
+
+        if line.lstrip().startswith(quote):
+            if not in_quote:
+                quotes+=1
+            in_quote=True
+        elif _list_item_re.match(line):
+            if not in_list:
+                lists+=1
+            in_list=True
+        elif not line[0].isspace():
+            in_list=False
+
+        links+=len(link_re.findall(line))
+
+    return {'links': links, 'lists': lists, 'quotes': quotes,
+            'code_blocks': code_blocks}
+
+
+
+#-------------------JSON lines report of a batch run-------------------
+class Report(object):
+    '''Write per-file records as JSON lines and keep the slowest files
+
+    <fileout>: str, path of the report, or None to only keep the summary.
+    <slowest>: int, number of slowest files kept for the summary.
+    '''
+
+    def __init__(self, fileout=None, slowest=10):
+        self.fileout=fileout
+        self.slowest=slowest
+        self.n=0
+        self.bytes_in=0
+        self.bytes_out=0
+        self.convert_time=0.
+        self._slowest=[]
+        # files passed through unconverted for their time budget
+        self.timed_out=[]
+        # (file, error) of the files that failed to convert
+        self.failed=[]
+        self._fout=None
+        if fileout is not None:
+            self._fout=io.open(fileout, 'w', encoding='utf-8')
+
+    def add(self, record):
+        '''Add the record of one file'''
+
+        self.n+=1
+        self.bytes_in+=record.get('bytes_in', 0)
+        self.bytes_out+=record.get('bytes_out', 0)
+        self.convert_time+=record.get('convert_time', 0.)
+        if record.get('timed_out'):
+            self.timed_out.append(record.get('file'))
+        if 'error' in record:
+            self.failed.append((record.get('file'), record['error']))
+
+        item=(record.get('convert_time', 0.), self.n, record)
+        if len(self._slowest)<self.slowest:
+            heapq.heappush(self._slowest, item)
+        elif item[0]>self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, item)
+
+        if self._fout is not None:
+            self._fout.write(json.dumps(record, ensure_ascii=False)+'\n')
+            self._fout.flush()
+
+    def slowestRecords(self):
+        '''Records of the slowest files, slowest first'''
+        return [rr for tt,nn,rr in sorted(self._slowest, reverse=True)]
+
+    def close(self):
+        if self._fout is not None:
+            self._fout.close()
+            self._fout=None
+
+    def printSummary(self, stream=None):
+        '''Print totals and the slowest files, to stderr by default'''
+
+        stream=sys.stderr if stream is None else stream
+        print('\n# <report>: %d files, %.1f kB in, %.1f kB out, '
+                'conversion %.2fs' %(self.n, self.bytes_in/1024.,
+                self.bytes_out/1024., self.convert_time), file=stream)
+        if self.timed_out:
+            print('# <report>: %d files over the time budget, left '
+                    'unconverted:' %len(self.timed_out), file=stream)
+            for ff in self.timed_out:
+                print('  %s' %ff, file=stream)
+        if self.failed:
+            print('# <report>: %d files failed:' %len(self.failed),
+                    file=stream)
+            for ff,ee in self.failed:
+                print('  %s: %s' %(ff, ee), file=stream)
+        if not self._slowest:
+            return
+        print('# <report>: Slowest files:', file=stream)
+        for rr in self.slowestRecords():
+            print('%8.3fs %9d bytes  %s' %(rr.get('convert_time', 0.),
+                rr.get('bytes_in', 0), rr.get('file')), file=stream)
+
@@ -0,0 +1,151 @@
+'''
+Split one Markdown file of many notes into a tree of Zim pages.
+
+The file is read once, line by line. Every heading of level 1 to <level>
+starts a new note, which becomes a page under the page of the last
+heading above it, e.g. "# Work" then "## Todo" gives Work.txt and
+Work/Todo.txt. Headings in fenced code do not split. Text before the
+first heading goes to a page named after the file.
+
+Notes are converted on worker processes as they are cut (see
+lib/batch.py), and written to a folder or an archive. Reference link
+definitions only apply to the note they are in.
+'''
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import os
+import re
+from collections import deque
+from lib import batch
+from lib import stream
+
+
+_atx_re = re.compile(r'^(#{1,6})[ \t]*(.+?)[ \t]*(?<!\\)#*[ \t]*$')
+_setext_re = re.compile(r'^(=+|-+)[ \t]*$')
+# characters not kept in page names
+_name_re = re.compile(r'[\s:/\\?*"<>|#]+')
+
+
+def pageName(title):
+    '''Zim page name of a heading, e.g. "Work: plans" -> "Work_plans"'''
+
+    return _name_re.sub('_', title).strip('_') or 'Untitled'
+
+def splitNotes(lines, level=1, name='Notes'):
+    '''Yield (names, text) of each note of a markdown text
+
+    <lines>: iterable of str, lines of the text with their line endings.
+    <level>: int, headings of this level and above start a new note.
+    <name>: str, page name of the text before the first heading.
+
+    <names> is a tuple of page names, from the top namespace down to the
+    page of the note. Notes of the same name under the same page get a
+    number appended.
+    '''
+
+    names=(pageName(name),)
+    parents=[]      # (level, name) of the pages above the current note
+    used=set()
+    note=[]
+    fence=False
+    prev=''
+
+    for line in lines:
+        stripped=line.rstrip('\r\n')
+        heading=None
+        if stripped.startswith('```'):
+            fence=not fence
+        elif not fence:
+            if stripped.startswith('#'):
+                match=_atx_re.match(stripped)
+                if match:
+                    heading=(len(match.group(1)), match.group(2), 0)
+            elif prev.strip() and stripped[:1] in '=-' and\
+                    _setext_re.match(stripped):
+                # the title is the line before, already in the note
+                heading=(1 if stripped[0]=='=' else 2, prev.strip(), 1)
+
+        if heading is not None and heading[0]<=level:
+            hlevel,title,back=heading
+            head=note[len(note)-back:]
+            del note[len(note)-back:]
+            if parents or ''.join(note).strip():
+                yield names, ''.join(note)
+                # the page of the text before the first heading too
+                used.add(names)
+
+            while parents and parents[-1][0]>=hlevel:
+                parents.pop()
+            page=pageName(title)
+            names=tuple(nn for ll,nn in parents)+(page,)
+            nn=2
+            while names in used:
+                names=names[:-1]+('%s_%d' %(page, nn),)
+                nn+=1
+            used.add(names)
+            parents.append((hlevel, names[-1]))
+            note=head
+
+        note.append(line)
+        prev='' if fence or heading is not None else stripped
+
+    if parents or ''.join(note).strip():
+        yield names, ''.join(note)
+
+
+def _readLines(filein):
+    if filein=='-':
+        fin=io.TextIOWrapper(stream._stdin(), encoding='utf-8')
+    else:
+        fin=io.open(filein, 'r', encoding='utf-8')
+    with fin:
+        for line in fin:
+            yield line
+
+
+
+#-------------------Convert the notes of a file-------------------
+def splitFile(converter, filein, fileout, level=1, workers=1, verbose=True):
+    '''Convert a markdown file of many notes into a tree of Zim pages
+
+    <converter>: Markdown2Zim obj.
+    <filein>: str, path to the markdown file, or '-' for stdin.
+    <fileout>: str, output folder, archive file or '-', see
+               batch.openWriter().
+    <level>: int, split at headings of this level and above.
+    <workers>: int, number of worker processes.
+
+    Return <n>: int, number of pages written.
+    '''
+
+    if filein=='-':
+        name,mtime='Notes',None
+    else:
+        name=os.path.splitext(os.path.basename(filein))[0]
+        mtime=os.path.getmtime(filein)
+    if verbose:
+        print('\n# <splitFile>: Splitting at level %d headings:' %level)
+        print(filein)
+
+    # names stay in this process, only texts go to the workers
+    pending=deque()
+    def items():
+        for names,text in splitNotes(_readLines(filein), level, name):
+            pending.append(os.path.join(*names)+'.txt')
+            yield text, None
+
+    n=0
+    writer=batch.openWriter(fileout)
+    try:
+        for result in batch.convertMany(converter, items(), workers):
+            writer.write(pending.popleft(), result, mtime)
+            n+=1
+    finally:
+        writer.close()
+
+    if verbose:
+        print('# <splitFile>: %d pages saved to:' %n)
+        print(fileout)
+
+    return n
@@ -0,0 +1,151 @@
+'''
+Convert documents read from a pipe, and write the results to a pipe.
+
+"-" stands for stdin or stdout. In framed mode a stream carries many
+documents, either separated by NUL characters, or one JSON value per
+line: a string, or an object with a "text" key, an optional "file" key
+(the path the text comes from) and any other keys, which are copied to
+the output object. Each result is written and flushed as soon as it is
+converted, so another process can feed documents one at a time.
+'''
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import sys
+import json
+from collections import deque
+from lib import tools
+
+
+FRAMES=('nul', 'jsonl')
+
+# Bytes read from a pipe at a time in NUL-delimited mode
+READ_SIZE = 64*1024
+
+
+def _stdin():
+    return getattr(sys.stdin, 'buffer', sys.stdin)
+
+def _stdout():
+    return getattr(sys.stdout, 'buffer', sys.stdout)
+
+def readText(filein):
+    '''Read a whole document from a file, or from stdin if <filein> is "-"
+    '''
+
+    if filein=='-':
+        return _stdin().read().decode('utf-8')
+    return tools.readFile(filein, False)
+
+def writeText(fileout, text):
+    '''Write a document to stdout, <fileout> being "-", or to a file'''
+
+    if fileout=='-':
+        out=_stdout()
+        out.write(text.encode('utf-8'))
+        out.flush()
+    else:
+        tools.saveFile(fileout, text, True, False)
+
+
+
+#-------------------Read documents from a framed stream-------------------
+def _readNul(fin):
+    # read1() returns what the pipe has, without waiting for a full block
+    read=getattr(fin, 'read1', fin.read)
+    # pieces of the document read so far, joined once it ends, so that a
+    # large document is not copied on every read
+    pieces=[]
+    while True:
+        data=read(READ_SIZE)
+        if not data:
+            break
+        # only the new bytes are searched for the end of a document
+        docs=data.split(b'\0')
+        if len(docs)>1:
+            pieces.append(docs[0])
+            yield b''.join(pieces).decode('utf-8'), None, None
+            for dd in docs[1:-1]:
+                yield dd.decode('utf-8'), None, None
+            pieces=[]
+        if docs[-1]:
+            pieces.append(docs[-1])
+    if pieces:
+        yield b''.join(pieces).decode('utf-8'), None, None
+
+def _readJSONLines(fin):
+    for line in fin:
+        if not line.strip():
+            continue
+        record=json.loads(line.decode('utf-8'))
+        if isinstance(record, dict):
+            extra=dict(record)
+            text=extra.pop('text')
+            yield text, extra.pop('file', None), extra
+        else:
+            yield record, None, None
+
+def readFrames(fin, frame):
+    '''Yield (text, file, extra) of each document in a framed stream
+
+    <fin>: binary file obj.
+    <frame>: str, 'nul' or 'jsonl'.
+
+    <extra> is the dict of other keys of a JSON lines record, or None.
+    '''
+
+    if frame=='nul':
+        return _readNul(fin)
+    return _readJSONLines(fin)
+
+def writeFrame(fout, text, frame, extra=None):
+    '''Write one converted document to a framed stream, and flush it'''
+
+    if frame=='nul':
+        fout.write(text.encode('utf-8')+b'\0')
+    elif extra is None:
+        fout.write(json.dumps(text).encode('utf-8')+b'\n')
+    else:
+        record=dict(extra)
+        record['text']=text
+        fout.write(json.dumps(record).encode('utf-8')+b'\n')
+    fout.flush()
+
+
+
+#-------------------Convert a framed stream-------------------
+def convertFrames(converter, filein, fileout, frame, workers=1):
+    '''Convert every document of a framed stream
+
+    <converter>: Markdown2Zim or Zim2Markdown obj.
+    <filein>, <fileout>: str, file paths, or "-" for stdin and stdout.
+    <frame>: str, 'nul' or 'jsonl'.
+    <workers>: int, number of processes. With more than 1, documents are
+               read ahead of the results written.
+
+    Return <n>: int, number of documents converted.
+    '''
+
+    fin=_stdin() if filein=='-' else io.open(filein, 'rb')
+    fout=_stdout() if fileout=='-' else io.open(fileout, 'wb')
+
+    n=0
+    try:
+        # extras stay in this process, only text and file go to workers
+        extras=deque()
+        def items():
+            for text,file,extra in readFrames(fin, frame):
+                extras.append(extra)
+                yield text, file
+
+        for result in converter.convert_many(items(), workers):
+            writeFrame(fout, result, frame, extras.popleft())
+            n+=1
+    finally:
+        if fin is not _stdin():
+            fin.close()
+        if fout is not _stdout():
+            fout.close()
+
+    return n
+
@@ -119,6 +119,29 @@ def saveFile(abpath_out,text,overwrite=True,verbose=True):
 
         
 
+#-------------------Find files in a folder tree-------------------
+def findFiles(folder,ext):
+    '''Find files with a given extension in a folder tree
+
+    <folder>: str, path to a folder.
+    <ext>: str or tuple of str, file extension(s), e.g. '.txt'.
+
+    Return <result>: list of str, sorted file paths.
+    '''
+
+    folder=expandUser(folder)
+    result=[]
+    for dirpath,dirnames,filenames in os.walk(folder):
+        dirnames.sort()
+        for ff in sorted(filenames):
+            if ff.lower().endswith(ext):
+                result.append(os.path.join(dirpath,ff))
+
+    return result
+
+
+
+
 #------------------Expand user home "~" in file names------------------
 def expandUser(path,verbose=True):
     '''Expand user home "~" in file names
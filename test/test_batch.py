@@ -0,0 +1,189 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import os
+import tarfile
+import zipfile
+import zim2markdown
+from lib import batch
+from lib.report import Report
+
+PAGE='''Content-Type: text/x-zim-wiki
+
+====== Page %d ======
+
+//italic// **bold** [[Home]]
+
+* item %d
+'''
+
+def _notebook(tmp_path):
+    folder=tmp_path/'notebook'
+    (folder/'Sub').mkdir(parents=True)
+    for ii in range(12):
+        sub=folder/'Sub' if ii%2 else folder
+        with io.open(str(sub/('Page%02d.txt' %ii)), 'w', encoding='utf-8') as fout:
+            fout.write(PAGE %(ii, ii))
+    return str(folder)
+
+def _expected(folder):
+    result=[]
+    for path in batch.tools.findFiles(folder, '.txt'):
+        conv=zim2markdown.Zim2Markdown(file=path)
+        name=os.path.splitext(os.path.relpath(path, folder))[0]+'.md'
+        result.append((name, conv.convert(open(path).read())))
+    return result
+
+
+def test_archives_match_serial(tmp_path, monkeypatch):
+    folder=_notebook(tmp_path)
+    expected=_expected(folder)
+    # a small window, so workers have to wait for the writer
+    monkeypatch.setattr(batch, 'PENDING_PER_WORKER', 1)
+    monkeypatch.setattr(batch, 'SERIAL_BYTES', 0)
+
+    out=str(tmp_path/'out.zip')
+    batch.convertFolder(zim2markdown.Zim2Markdown(), folder, out, '.txt',
+            '.md', workers=2, verbose=False)
+    with zipfile.ZipFile(out) as archive:
+        got=[(nn, archive.read(nn).decode('utf-8')) for nn in
+                archive.namelist()]
+    assert got==expected
+
+    out=str(tmp_path/'out.tar.gz')
+    batch.convertFolder(zim2markdown.Zim2Markdown(), folder, out, '.txt',
+            '.md', workers=2, verbose=False)
+    with tarfile.open(out) as archive:
+        got=[(mm.name, archive.extractfile(mm).read().decode('utf-8'))
+                for mm in archive.getmembers()]
+    assert got==expected
+
+    out=str(tmp_path/'out')
+    batch.convertFolder(zim2markdown.Zim2Markdown(), folder, out, '.txt',
+            '.md', verbose=False)
+    for name,text in expected:
+        with io.open(os.path.join(out, name), encoding='utf-8') as fin:
+            assert fin.read()==text
+
+
+def test_convert_many(tmp_path):
+    folder=_notebook(tmp_path)
+    paths=batch.tools.findFiles(folder, '.txt')
+    expected=[text for name,text in _expected(folder)]
+    conv=zim2markdown.Zim2Markdown()
+
+    def items():
+        for pp in paths:
+            yield open(pp).read(), pp
+
+    assert list(conv.convert_many(items()))==expected
+    assert list(conv.convert_many(items(), workers=2))==expected
+
+    # results come lazily, before all the items are read
+    seen=[]
+    def tracked():
+        for item in items():
+            seen.append(item)
+            yield item
+    results=conv.convert_many(tracked())
+    assert next(results)==expected[0]
+    assert len(seen)==1
+
+def test_resume(tmp_path):
+    folder=_notebook(tmp_path)
+    out=str(tmp_path/'out')
+    assert batch.convertFolder(zim2markdown.Zim2Markdown(), folder, out,
+            '.txt', '.md', verbose=False)==12
+
+    # one page changed, one touched only, one output lost
+    with io.open(os.path.join(folder, 'Page00.txt'), 'a') as fout:
+        fout.write('more\n')
+    page=os.path.join(folder, 'Page02.txt')
+    os.utime(page, (0, 0))
+    os.remove(os.path.join(out, 'Page04.md'))
+
+    converted=[]
+    class Spy(zim2markdown.Zim2Markdown):
+        def convert(self, text, file=None):
+            converted.append(os.path.basename(file))
+            return super(Spy, self).convert(text, file)
+
+    assert batch.convertFolder(Spy(), folder, out, '.txt', '.md',
+            verbose=False, resume=True)==2
+    assert sorted(converted)==['Page00.txt', 'Page04.txt']
+    expected=dict(_expected(folder))
+    for name in ('Page00.md', 'Page02.md', 'Page04.md'):
+        with io.open(os.path.join(out, name), encoding='utf-8') as fin:
+            assert fin.read()==expected[name]
+
+    # all done now
+    assert batch.convertFolder(Spy(), folder, out, '.txt', '.md',
+            verbose=False, resume=True)==0
+
+def test_failed_pages(tmp_path, monkeypatch):
+    folder=_notebook(tmp_path)
+    def h_sub(self, match):
+        if 'Page 3' in match.group():
+            raise KeyError('x')
+        return '# %s\n\n' %match.group(2)
+    monkeypatch.setattr(zim2markdown.Zim2Markdown, '_h_sub', h_sub)
+    monkeypatch.setattr(batch, 'SERIAL_BYTES', 0)
+
+    out=str(tmp_path/'out')
+    report=Report()
+    n=batch.convertFolder(zim2markdown.Zim2Markdown(), folder, out, '.txt',
+            '.md', workers=2, verbose=False, report=report)
+    assert n==11
+    assert not os.path.exists(os.path.join(out, 'Sub', 'Page03.md'))
+    assert os.path.exists(os.path.join(out, 'Sub', 'Page05.md'))
+    assert [(os.path.basename(ff), ee) for ff,ee in report.failed]==\
+            [('Page03.txt', "KeyError: 'x'")]
+
+def test_recycled_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, 'SERIAL_BYTES', 0)
+    folder=_notebook(tmp_path)
+    paths=batch.tools.findFiles(folder, '.txt')
+    expected=[text for name,text in _expected(folder)]
+    conv=zim2markdown.Zim2Markdown()
+
+    got=[text for pp,text,rr in batch.convertPages(conv, paths, 2,
+            max_tasks=1)]
+    assert got==expected
+
+    # every result is over the limit, the pool moves on each time
+    with batch.WorkerPool(conv, 2, max_rss=1) as pool:
+        got=[text for text,rr in batch._imapOrdered(pool,
+            batch._convertPageTask, ((pp, False) for pp in paths), 4)]
+        assert pool.recycled>1
+    assert got==expected
+
+def test_size_scheduling(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, 'CHUNK_BYTES', 100)
+    monkeypatch.setattr(batch, 'CHUNK_PAGES', 2)
+    assert batch.sizeChunks(['a', 'b', 'c', 'd', 'e'], [10, 500, 20, 30, 5])==\
+            [['b'], ['d', 'c'], ['a', 'e']]
+    assert batch.sizeChunks(['a', 'b', 'c'], [10, 500, 20], 1)==\
+            [['b'], ['c'], ['a']]
+
+    folder=_notebook(tmp_path)
+    paths=batch.tools.findFiles(folder, '.txt')
+    expected=dict(zip(paths, (text for name,text in _expected(folder))))
+    conv=zim2markdown.Zim2Markdown()
+    monkeypatch.setattr(batch, 'SERIAL_BYTES', 0)
+    got=batch.convertPages(conv, paths, 2, ordered=False)
+    assert dict((pp, text) for pp,text,rr in got)==expected
+
+    # recycled workers get one page per task
+    chunks=[]
+    sizeChunks=batch.sizeChunks
+    monkeypatch.setattr(batch, 'sizeChunks',
+            lambda *args: chunks.extend(sizeChunks(*args)) or chunks)
+    got=batch.convertPages(conv, paths, 2, max_tasks=2, ordered=False)
+    assert dict((pp, text) for pp,text,rr in got)==expected
+    assert [len(cc) for cc in chunks]==[1]*len(paths)
+
+    # a small batch stays in this process
+    monkeypatch.setattr(batch, 'SERIAL_BYTES', 10**6)
+    monkeypatch.setattr(batch, 'WorkerPool', None)
+    got=batch.convertPages(conv, paths, 2, ordered=False)
+    assert [pp for pp,text,rr in got]==paths
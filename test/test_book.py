@@ -0,0 +1,67 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import zim2markdown
+from lib import book
+
+PAGES={
+    'Home.txt': 'Content-Type: text/x-zim-wiki\nWiki-Format: zim 0.4\n\n'
+            '====== Home ======\n\n[[Work]] and [[+Sub]] and [[Nope]]\n\n'
+            '```\n# not a heading\n```\n',
+    'Home/Sub.txt': '====== Sub ======\n\nback [[Home]]\n\n===== Part =====\n',
+    'Work.txt': '====== Work ======\n\n[[+Todo]]\n',
+    'Work/Todo.txt': '====== Todo ======\n',
+}
+
+def _notebook(tmp_path):
+    folder=tmp_path/'Notes'
+    (folder/'Home').mkdir(parents=True)
+    (folder/'Work').mkdir()
+    (folder/'notebook.zim').write_text('')
+    for name,text in PAGES.items():
+        (folder/name).write_text(text)
+    return str(folder)
+
+
+def test_book(tmp_path):
+    folder=_notebook(tmp_path)
+    out=str(tmp_path/'book.md')
+    n=book.exportBook(zim2markdown.Zim2Markdown(), folder, out, workers=2,
+            verbose=False)
+    assert n==4
+    with io.open(out, encoding='utf-8') as fin:
+        text=fin.read()
+
+    assert text=='''<a id="home"></a>
+
+# Home
+
+[Work](#work) and [Sub](#home-sub) and [Nope](Nope)
+
+```
+# not a heading
+```
+
+<a id="home-sub"></a>
+
+## Sub
+
+back [Home](#home)
+
+## Part
+
+<a id="work"></a>
+
+# Work
+
+[Todo](#work-todo)
+
+<a id="work-todo"></a>
+
+## Todo
+'''
+
+def test_shift_headings():
+    text='# a\n\n```\n# code\n```\n\n###### deep\n#not'
+    assert book.shiftHeadings(text, 1)==\
+            '## a\n\n```\n# code\n```\n\n###### deep\n#not'
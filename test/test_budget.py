@@ -0,0 +1,49 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+import re
+import signal
+import pytest
+import markdown2zim
+from lib import batch
+from lib import budget
+
+pytestmark=pytest.mark.skipif(not budget.canInterrupt(),
+        reason='no SIGALRM timer')
+
+def _backtrack(self, text):
+    # a regex backtracking for far longer than any budget below
+    re.match(r'(a+)+b', 'a'*64)
+    return text
+
+
+def test_time_limit():
+    with pytest.raises(budget.BudgetExceeded):
+        with budget.timeLimit(0.05):
+            re.match(r'(a+)+b', 'a'*64)
+    # no timer left behind
+    assert signal.getitimer(signal.ITIMER_REAL)[0]==0
+
+    # an enclosing budget keeps running
+    with pytest.raises(budget.BudgetExceeded):
+        with budget.timeLimit(0.1):
+            with budget.timeLimit(5):
+                pass
+            re.match(r'(a+)+b', 'a'*64)
+
+def test_passthrough(monkeypatch, tmp_path):
+    text='# Title\n\n*a* [b](http://b.com)\n'
+    conv=markdown2zim.Markdown2Zim(time_budget=5)
+    expected=markdown2zim.Markdown2Zim().convert(text)
+    assert conv.convert(text)==expected
+    assert not conv.timed_out
+
+    monkeypatch.setattr(markdown2zim.Markdown2Zim, '_run_block_gamut',
+            _backtrack)
+    conv=markdown2zim.Markdown2Zim(time_budget=0.05)
+    assert conv.convert(text)==text
+    assert conv.timed_out
+
+    path=tmp_path/'page.md'
+    path.write_text(text)
+    result,record=batch.convertPage(conv, str(path))
+    assert result==text and record['timed_out']
@@ -0,0 +1,27 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+import markdown2zim
+from lib.cache import SpanCache
+
+
+def test_span_cache_same_output_and_hits():
+    text='\n\n'.join(['## Daily log', '- [ ] *review* [notes][n]',
+        '-- signed, **me**']*50)
+    text+='\n\n[n]: http://x.com/a_b\n'
+
+    cache=SpanCache(16)
+    result=markdown2zim.Markdown2Zim(span_cache=cache).convert(text)
+
+    assert result==markdown2zim.Markdown2Zim().convert(text)
+    assert cache.hits>cache.misses
+    assert len(cache)<=16
+
+
+def test_span_cache_keyed_on_link_definitions():
+    cache=SpanCache()
+    conv=markdown2zim.Markdown2Zim(span_cache=cache)
+
+    a=conv.convert('[x][n]\n\n[n]: http://a.com\n')
+    b=conv.convert('[x][n]\n\n[n]: http://b.com\n')
+    assert 'http://a.com' in a
+    assert 'http://b.com' in b
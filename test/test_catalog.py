@@ -0,0 +1,70 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import json
+import sqlite3
+from contextlib import closing
+from lib import catalog
+
+ZIM_PAGE="""Content-Type: text/x-zim-wiki
+Wiki-Format: zim 0.4
+Creation-Date: 2020-01-02T10:00:00+08:00
+
+====== Todo ======
+
+===== Work =====
+'''
+==== not a heading ====
+'''
+
+==== Reading ====
+"""
+
+MD_PAGE='''# Title
+
+```
+# not a heading
+```
+
+Section
+-------
+'''
+
+def _write(path, text):
+    with io.open(str(path), 'w', encoding='utf-8') as fout:
+        fout.write(text)
+
+
+def test_scan_zim(tmp_path):
+    _write(tmp_path/'Todo.txt', ZIM_PAGE)
+    headers,outline=catalog.scanZim(str(tmp_path/'Todo.txt'))
+
+    assert headers['Creation-Date']=='2020-01-02T10:00:00+08:00'
+    assert outline==[(1, 'Todo'), (1, 'Work'), (2, 'Reading')]
+
+def test_scan_markdown(tmp_path):
+    _write(tmp_path/'a.md', MD_PAGE)
+    headers,outline=catalog.scanMarkdown(str(tmp_path/'a.md'))
+
+    assert outline==[(1, 'Title'), (2, 'Section')]
+
+def test_build_catalog(tmp_path):
+    (tmp_path/'Notes').mkdir()
+    _write(tmp_path/'Notes'/'Todo.txt', ZIM_PAGE)
+    _write(tmp_path/'Home.txt', 'no header\n')
+
+    out=str(tmp_path/'catalog.json')
+    catalog.buildCatalog(str(tmp_path), out, 'zim', verbose=False)
+    with io.open(out, encoding='utf-8') as fin:
+        records=json.load(fin)
+    assert [rr['page'] for rr in records]==['Home', 'Notes:Todo']
+    assert records[0]['title']=='Home'
+    assert records[1]['title']=='Todo'
+
+    out=str(tmp_path/'catalog.db')
+    catalog.buildCatalog(str(tmp_path), out, 'zim', workers=2, verbose=False)
+    with closing(sqlite3.connect(out)) as db:
+        rows=db.execute('SELECT page, level, text FROM pages JOIN headings '
+                'ON headings.page_id=pages.id ORDER BY pages.id, position')
+        assert list(rows)==[('Notes:Todo', 1, 'Todo'), ('Notes:Todo', 1,
+            'Work'), ('Notes:Todo', 2, 'Reading')]
@@ -0,0 +1,126 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+import re
+import random
+import markdown2zim
+import zim2markdown
+from lib.core import Converter, LazyPattern
+
+
+def test_lazy_pattern():
+    class Demo(object):
+        word_re = LazyPattern(r'\w+', re.U)
+
+    assert isinstance(Demo.__dict__['word_re'], LazyPattern)
+    compiled=Demo().word_re
+    assert compiled.findall('a b')==['a', 'b']
+    # compiled once, then a plain class attribute
+    assert Demo.__dict__['word_re'] is compiled
+    assert Demo.word_re is compiled
+
+def test_converters_share_core():
+    for cls in (markdown2zim.Markdown2Zim, zim2markdown.Zim2Markdown):
+        assert issubclass(cls, Converter)
+        assert '_do_lists' not in cls.__dict__
+        assert '_do_links' in cls.__dict__
+
+def test_code_and_verbatim_kept():
+    md='text\n\n```sh\n# comment *not* a heading\n- not a list\n```\n\n# heading\n'
+    out=markdown2zim.Markdown2Zim().convert(md)
+    assert '```sh\n# comment *not* a heading\n- not a list\n```' in out
+    assert '===== heading =====' in out
+    # the lines of a quoted code block are indented with the quote
+    out=markdown2zim.Markdown2Zim().convert('> ```\n> # a\n> b\n> ```\n')
+    assert out=="'''\n  ```\n  # a\n  b\n  ```\n'''\n"
+
+    zim="'''\n  = not a heading =\n  //not italic//\n'''\n\n```\n* x\n```\n"
+    out=zim2markdown.Zim2Markdown().convert(zim)
+    assert out=='> = not a heading =\n> //not italic//\n\n```\n* x\n```\n'
+    # fences that pair up again around a protected block leave no token
+    out=zim2markdown.Zim2Markdown().convert('```\n```\n```\n\n```\n```\n```')
+    assert 'md5-' not in out
+
+def test_stages_skipped_without_marks(monkeypatch):
+    def fail(self, text):
+        raise AssertionError('stage run on %r' %text)
+    for name in ('_do_links', '_do_italics_and_bold',
+            '_do_code_spans', '_do_lists', '_do_headers'):
+        monkeypatch.setattr(markdown2zim.Markdown2Zim, name, fail)
+        monkeypatch.setattr(zim2markdown.Zim2Markdown, name, fail)
+
+    text='Plain prose, with no markup.\n\nAnother paragraph.\n'
+    assert markdown2zim.Markdown2Zim().convert(text)==text
+    assert zim2markdown.Zim2Markdown().convert(text)==text
+
+class _EveryStage(object):
+    """Runs every stage of both gamuts, as the converters did before they
+    looked for the marks of each stage first."""
+
+    class _All(object):
+        def __contains__(self, stage):
+            return True
+
+    _list_mark_re=re.compile('')
+    _strike_re=re.compile(r"~~(?=\S)(.+?)(?<=\S)~~", re.S)
+
+    def _find_marks(self, text, marks):
+        return self._All()
+
+    def _do_italics_and_bold(self, text):
+        # the strike pass ran before emphasis
+        text=self._strike_re.sub(r"~~\1~~", text)
+        return super(_EveryStage, self)._do_italics_and_bold(text)
+
+class _EveryStageM2Z(_EveryStage, markdown2zim.Markdown2Zim):
+    def _fill_hased(self, text):
+        # one replace() per hash
+        for kk,vv in self._escape_table.items():
+            text=text.replace(vv,kk)
+        return text
+
+class _EveryStageZ2M(_EveryStage, zim2markdown.Zim2Markdown):
+    pass
+
+MD_PIECES=['# Head', 'Setext', '===', '---', '- item', '* item', '1. one',
+    '  nested', '    code', '> quote', '> > deeper', '```', '```sh', 'text',
+    '*em*', '**strong**', '_u_', '__uu__', '`code`', '``a`b``', '~~s~~',
+    '[link](http://a.com/b_c)', '![img](x.png)', '[ref][id]', '[id]: http://x',
+    '<http://a.com>', r'\*esc\*', 'a_b_c', '*open', '[open', '', '', '']
+ZIM_PIECES=['====== Head ======', '=== Sub ===', '* item', '	* nested',
+    '1. one', "'''", "'''verbatim'''", '```', 'text', '//it//',
+    '**bold**', '__mark__', '~~s~~', "''code''", '[[Page]]',
+    '[[http://a.com|x]]', '{{./img.png}}', '[[+Sub:Page|y]]', 'a//b', '**open',
+    '[[open', '', '', '']
+
+def _documents(pieces, n, seed):
+    rng=random.Random(seed)
+    for _ in range(n):
+        lines=[]
+        for _ in range(rng.randint(1, 12)):
+            line=rng.choice(pieces)
+            if rng.random()<.3:
+                line+=' '+rng.choice(pieces)
+            lines.append(line)
+        yield '\n'.join(lines)+rng.choice(['', '\n'])
+
+def test_stages_skipped_match_every_stage():
+    # skipping stages and passes must leave the output as it was
+    for new,old,pieces in ((markdown2zim.Markdown2Zim, _EveryStageM2Z,
+            MD_PIECES), (zim2markdown.Zim2Markdown, _EveryStageZ2M,
+            ZIM_PIECES)):
+        for text in _documents(pieces, 500, 1):
+            assert new().convert(text)==old().convert(text), text
+
+def test_hashed_and_weird_in_one_pass():
+    conv=markdown2zim.Markdown2Zim()
+    out=conv.convert('﻿a [x](http://a.com/b_c*d_) ~~s~~ *e*\n')
+    assert out=='a [[http://a.com/b_c*d_|x]] ~~s~~ //e//\n'
+
+def test_normalize():
+    conv=markdown2zim.Markdown2Zim()
+    assert conv._normalize('a\r\nb\rc \n \t\n﻿d')=='a\nb\nc \n\nd\n\n'
+    # a line of spaces and a BOM is blank too
+    assert conv._normalize('a\n ﻿\t\r\n')=='a\n\n\n\n'
+    # a BOM does not hide the header after it
+    assert conv.convert('﻿# Title\r\n')=='===== Title =====\n'
+    assert zim2markdown.Zim2Markdown()._normalize('a\n\n')=='a\n\n\n\n'
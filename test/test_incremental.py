@@ -0,0 +1,51 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+import os
+import markdown2zim
+import zim2markdown
+from lib.incremental import IncrementalConverter
+
+HERE=os.path.dirname(os.path.abspath(__file__))
+
+
+def test_incremental_reconverts_only_edited_blocks():
+    with open(os.path.join(HERE,'sample.md')) as fin:
+        text=fin.read()
+    text='\n\n'.join([text]*5)
+
+    inc=IncrementalConverter(markdown2zim.Markdown2Zim())
+    inc.convert(text)
+
+    text=text.replace('This is an inline code','This is **edited** code',1)
+    result=inc.convert(text)
+
+    assert result==markdown2zim.Markdown2Zim().convert(text)
+    assert inc.converted==1
+    assert inc.reused>10
+
+
+def test_incremental_follows_link_definitions():
+    inc=IncrementalConverter(markdown2zim.Markdown2Zim())
+    inc.convert('see [here][a]\n\nplain\n\n[a]: http://a.com\n')
+
+    text='see [here][a]\n\nplain\n\n[a]: http://b.com\n'
+    result=inc.convert(text)
+
+    assert 'http://b.com' in result
+    assert result==markdown2zim.Markdown2Zim().convert(text)
+    assert inc.converted==1
+
+
+def test_incremental_keeps_open_list_with_next_block():
+    inc=IncrementalConverter(markdown2zim.Markdown2Zim())
+    text='para one\n\n- \n\nnext para\n\nlast\n'
+    assert inc.convert(text)==markdown2zim.Markdown2Zim().convert(text)
+
+    text=text.replace('last', 'last edited')
+    assert inc.convert(text)==markdown2zim.Markdown2Zim().convert(text)
+
+    # an empty item right under a heading
+    inc=IncrementalConverter(zim2markdown.Zim2Markdown())
+    text='== Head ==\n* \n\nnext para\n'
+    assert inc.convert(text)=='#### Head\n\n* next para\n'
+    assert inc.convert(text)==zim2markdown.Zim2Markdown().convert(text)
@@ -0,0 +1,72 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+import os
+import markdown2zim
+import zim2markdown
+from lib import parallel
+
+HERE=os.path.dirname(os.path.abspath(__file__))
+
+ZIM_TEXT="""
+===== heading1 =====
+
+this is test //**bold test**// of markdown ** ~~parser~~
+test.
+
+* item1;
+* item2;
+
+1. num1;
+2. num2;
+
+'''
+this is a quote block,
+quote block continues.
+'''
+
+[[linka]] [[+linkc|link title]] {{https:toimagesite.com}}
+
+```
+this is a code block,
+
+# still a code block,
+```
+"""
+
+
+def test_markdown_parallel_same_as_serial(monkeypatch):
+    with open(os.path.join(HERE,'sample.md')) as fin:
+        text=fin.read()
+    # code in quotes is protected in the worker processes
+    text+='\n\n> ```\n> # not a heading\n> ```\n'
+    text='\n\n'.join([text]*20)
+
+    monkeypatch.setattr(parallel,'CHUNK_SIZE',1)
+    serial=markdown2zim.Markdown2Zim().convert(text)
+    assert markdown2zim.Markdown2Zim(workers=3).convert(text)==serial
+
+
+def test_zim_parallel_same_as_serial(monkeypatch):
+    text='\n\n'.join([ZIM_TEXT]*20)
+
+    monkeypatch.setattr(parallel,'CHUNK_SIZE',1)
+    serial=zim2markdown.Zim2Markdown().convert(text)
+    assert zim2markdown.Zim2Markdown(workers=3).convert(text)==serial
+
+
+def test_no_cut_after_open_list(monkeypatch):
+    # an empty item takes the next paragraph as its text
+    monkeypatch.setattr(parallel,'CHUNK_SIZE',1)
+    for conv,mark in ((markdown2zim.Markdown2Zim,'-'),
+            (zim2markdown.Zim2Markdown,'*')):
+        text='para one\n\n%s \n\nnext para\n\nlast\n' %mark
+        serial=conv().convert(text)
+        assert serial=='para one\n\n* next para\n\nlast\n'
+        assert conv(workers=2).convert(text)==serial
+
+    # the item may follow a heading in the same paragraph
+    for conv,text in (
+            (zim2markdown.Zim2Markdown,'== Head ==\n* \n\nnext para\n'),
+            (markdown2zim.Markdown2Zim,'Title\n---\n* \n\nx'),
+            (markdown2zim.Markdown2Zim,'***\n- \n* \n\ntext\n')):
+        assert conv(workers=2).convert(text)==conv().convert(text)
@@ -0,0 +1,146 @@
+'''
+Adversarial inputs that blow up naive converters.
+
+Each case generates an input of at least <size> characters, doubled
+until converting it takes MIN_TIME, so that timings are well above the
+noise. Converting four times that size must finish within the per-case
+time limit, and must take at most GROWTH times as long: linear growth
+gives 4, quadratic growth 16.
+'''
+from __future__ import print_function
+from __future__ import unicode_literals
+import time
+import pytest
+import markdown2zim
+import zim2markdown
+
+# 4**1.5: halfway between linear (4) and quadratic (16) growth, in log
+GROWTH=8.0
+
+# the base size is doubled until a conversion takes this long
+MIN_TIME=0.1
+# but not beyond this many times the size of the case
+MAX_DOUBLINGS=6
+
+M2Z=markdown2zim.Markdown2Zim
+Z2M=zim2markdown.Zim2Markdown
+
+def _slow(reason):
+    # not run, these take minutes at the sizes used here
+    return pytest.mark.xfail(reason=reason, run=False)
+
+def _quadratic(reason):
+    return pytest.mark.xfail(reason=reason)
+
+CASES=[
+    # converter, input generator, size, time limit in seconds
+    pytest.param(M2Z, lambda n: '['*n, 8000, 5.,
+        id='md-unmatched-brackets'),
+    pytest.param(M2Z, lambda n: 'a [ b '*(n//6), 8000, 5.,
+        id='md-unmatched-brackets-in-text'),
+    pytest.param(M2Z, lambda n: '- [ ] item\n'*(n//11), 8000, 5.,
+        id='md-checkbox-list'),
+    # the copies only outweigh the rest of the work on long paragraphs
+    pytest.param(M2Z, lambda n: '[a](u) '*(n//7), 128000, 5.,
+        id='md-links',
+        marks=_quadratic('each link copies the rest of the paragraph')),
+    pytest.param(M2Z, lambda n: '[a]('*(n//4), 8000, 5.,
+        id='md-unclosed-link-urls'),
+    pytest.param(M2Z, lambda n: '> '*(n//40)+'x\n', 8000, 5.,
+        id='md-deeply-nested-quote',
+        marks=_quadratic('the output grows with the square of the depth')),
+    pytest.param(M2Z, lambda n: ''.join('>'*(i%50+1)+' q\n'
+        for i in range(n//30)), 8000, 5.,
+        id='md-many-nested-quotes'),
+    pytest.param(M2Z, lambda n: ''.join('>'*(i%50+1)+' (see *this*) q\n'
+        for i in range(n//45)), 8000, 5.,
+        id='md-many-nested-quotes-markup'),
+    pytest.param(M2Z, lambda n: '```\n'+'code line\n'*(n//10), 8000, 5.,
+        id='md-unclosed-fence'),
+    pytest.param(M2Z, lambda n: '\n\n```\n'*(n//6), 4000, 5.,
+        id='md-fence-markers'),
+    pytest.param(M2Z, lambda n: ''.join('`'*(i%40+1)+'x '
+        for i in range(n//22)), 8000, 5.,
+        id='md-backtick-runs'),
+    pytest.param(M2Z, lambda n: ''.join('`'*i+' x '
+        for i in range(1, int((2*n)**.5))), 8000, 5.,
+        id='md-unclosed-backtick-runs'),
+    pytest.param(M2Z, lambda n: '*'*n, 8000, 5.,
+        id='md-star-run'),
+    pytest.param(M2Z, lambda n: '*a '*(n//3), 8000, 5.,
+        id='md-unclosed-emphasis',
+        marks=_slow('each * scans to the end of the paragraph')),
+    pytest.param(M2Z, lambda n: '_a '*(n//3), 8000, 5.,
+        id='md-unclosed-underscores',
+        marks=_slow('each _ scans to the end of the paragraph')),
+    pytest.param(M2Z, lambda n: '~~a '*(n//4), 8000, 5.,
+        id='md-unclosed-strike'),
+    pytest.param(M2Z, lambda n: '- item\n'*(n//7), 4000, 5.,
+        id='md-long-list'),
+
+    pytest.param(Z2M, lambda n: '[['*(n//2), 8000, 5.,
+        id='zim-unmatched-brackets',
+        marks=_slow('each [[ scans MAX_LINK_TEXT_SENTINEL chars')),
+    pytest.param(Z2M, lambda n: '{{'*(n//2), 8000, 5.,
+        id='zim-unmatched-braces',
+        marks=_slow('each {{ scans MAX_LINK_TEXT_SENTINEL chars')),
+    pytest.param(Z2M, lambda n: '[[a]] '*(n//6), 16000, 5.,
+        id='zim-links',
+        marks=_quadratic('each link copies the rest of the paragraph')),
+    pytest.param(Z2M, lambda n: '//'*(n//2), 8000, 5.,
+        id='zim-slash-run'),
+    pytest.param(Z2M, lambda n: '//a '*(n//4), 8000, 5.,
+        id='zim-unclosed-italic',
+        marks=_slow('each // scans to the end of the paragraph')),
+    pytest.param(Z2M, lambda n: '*'*n, 8000, 5.,
+        id='zim-star-run'),
+    pytest.param(Z2M, lambda n: "'''\n"+'log line\n'*(n//9)+"'''\n",
+        8000, 5., id='zim-verbatim'),
+    # pasted logs, 1 and 2 MB
+    pytest.param(Z2M, lambda n: "'''\n"+'12:00:01  INFO  worker  done\n'
+        *(n//30)+"'''\n", 2**20, 2., id='zim-verbatim-logs'),
+    pytest.param(Z2M, lambda n: "'''\n"+'log line\n'*(n//9), 8000, 5.,
+        id='zim-unclosed-verbatim'),
+    pytest.param(Z2M, lambda n: '```\n'+'code line\n'*(n//10), 8000, 5.,
+        id='zim-unclosed-fence'),
+    pytest.param(Z2M, lambda n: ''.join('`'*(i%40+1)+'x '
+        for i in range(n//22)), 8000, 5.,
+        id='zim-backtick-runs'),
+    pytest.param(Z2M, lambda n: ''.join('`'*i+' x '
+        for i in range(1, int((2*n)**.5))), 8000, 5.,
+        id='zim-unclosed-backtick-runs'),
+    pytest.param(Z2M, lambda n: '* item\n'*(n//7), 8000, 5.,
+        id='zim-long-list'),
+]
+
+
+def _time(converter, text, repeat=3):
+    best=None
+    for ii in range(repeat):
+        t0=time.perf_counter()
+        converter().convert(text)
+        dt=time.perf_counter()-t0
+        best=dt if best is None else min(best,dt)
+        if best>5*MIN_TIME:
+            # noise is small next to that
+            break
+    return best
+
+
+@pytest.mark.parametrize('converter,make,size,limit', CASES)
+def test_near_linear_scaling(converter, make, size, limit):
+    t1=_time(converter, make(size))
+    for ii in range(MAX_DOUBLINGS):
+        if t1>=MIN_TIME:
+            break
+        size*=2
+        t1=_time(converter, make(size))
+    t2=_time(converter, make(4*size))
+    if t2>=GROWTH*max(t1,MIN_TIME/4):
+        # measure again, once, in case the machine was busy
+        t1=_time(converter, make(size))
+        t2=_time(converter, make(4*size))
+
+    assert t2<limit, 'took %.2fs for %d chars' %(t2, 4*size)
+    assert t2<GROWTH*max(t1,MIN_TIME/4),\
+            'quadrupling input took %.1fx longer' %(t2/t1)
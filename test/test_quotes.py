@@ -0,0 +1,35 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+import pytest
+import markdown2zim
+
+
+TEXTS=[
+    '> a\n> b\n\n> c\n',
+    '> a\n> > b\n> > c\n>\n> d\n',
+    '> > > deep\n> > back\n> out\nlazy\n',
+    '> a\n>\n> > b\n> >\n> > c\n\nafter\n',
+    '> *em* and **strong**\n> > [link](http://x/a_b)\n',
+    '> # title\n> > quoted\n',
+    '> - item\n> > quoted\n',
+    '> a\n> > b\n===\n',
+    # span markup in the nested quotes, which the span gamut of every
+    # level around them runs over again
+    '> a\n> > (see *this*)\n> > > **b** and `[x](`\n',
+    '> [a](\n> > b)\n> > > c_d\n',
+]
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_nested_quotes_match_recursion(text, monkeypatch):
+    expected=markdown2zim.Markdown2Zim().convert(text)
+    # the recursive conversion, one quote level at a time
+    monkeypatch.setattr(markdown2zim.Markdown2Zim, '_parse_quote_levels',
+            lambda self, bq: None)
+    assert markdown2zim.Markdown2Zim().convert(text)==expected
+
+def test_deep_quote():
+    # deeper than the recursion could go
+    out=markdown2zim.Markdown2Zim().convert('> '*2000+'x\n')
+    lines=out.split('\n')
+    assert lines[2000]=='  '*2000+'x'
+    assert lines.count("'''".rjust(2*1999+3))==2
@@ -0,0 +1,49 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import json
+from lib.report import Report, countElements
+
+MD_TEXT='''# Title
+
+See [a](http://a.com) and [b][ref].
+
+- one
+- two
+
+    indented
+
+- three
+
+> quote
+> more
+
+```
+- not a list
+[not](a link)
+```
+
+1. other list
+'''
+
+def test_count_markdown():
+    assert countElements(MD_TEXT, 'markdown')=={'links': 2, 'lists': 2,
+            'quotes': 1, 'code_blocks': 1}
+
+def test_count_zim():
+    text="[[Page]] and [[http://a.com|a]]\n\n* one\n* two\n\n'''\n[[no]]\n'''\n"
+    assert countElements(text, 'zim')=={'links': 2, 'lists': 1,
+            'quotes': 0, 'code_blocks': 1}
+
+def test_report(tmp_path):
+    out=str(tmp_path/'report.jsonl')
+    report=Report(out, slowest=2)
+    for ii,tt in enumerate([0.1, 0.5, 0.2, 0.05]):
+        report.add({'file': 'f%d' %ii, 'convert_time': tt, 'bytes_in': 10})
+    report.close()
+
+    with io.open(out, encoding='utf-8') as fin:
+        records=[json.loads(ll) for ll in fin]
+    assert [rr['file'] for rr in records]==['f0', 'f1', 'f2', 'f3']
+    assert [rr['file'] for rr in report.slowestRecords()]==['f1', 'f2']
+    assert report.bytes_in==40
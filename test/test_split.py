@@ -0,0 +1,63 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import os
+import markdown2zim
+from lib import split
+
+NOTES='''Exported from somewhere.
+
+# Work
+
+Some *plans*.
+
+## Todo: this week
+
+- item
+
+```
+# not a heading
+```
+
+Home
+====
+
+## Todo: this week
+
+again
+
+### Deep
+
+# Work
+'''
+
+def test_split_notes():
+    notes=list(split.splitNotes(io.StringIO(NOTES), 2, 'export'))
+    names=[nn for nn,tt in notes]
+    assert names==[('export',), ('Work',), ('Work', 'Todo_this_week'),
+            ('Home',), ('Home', 'Todo_this_week'), ('Work_2',)]
+    assert ''.join(tt for nn,tt in notes)==NOTES
+    assert notes[2][1].endswith('```\n\n')
+    assert notes[3][1].startswith('Home\n====\n')
+    assert '### Deep' in notes[4][1]
+
+    # a heading named as the page of the text before it
+    notes=split.splitNotes(io.StringIO('intro\n\n# Notes\n\nx\n'), 1)
+    assert [nn for nn,tt in notes]==[('Notes',), ('Notes_2',)]
+    notes=split.splitNotes(io.StringIO('# Notes\n\nx\n'), 1)
+    assert [nn for nn,tt in notes]==[('Notes',)]
+
+def test_split_file(tmp_path):
+    filein=str(tmp_path/'export.md')
+    with io.open(filein, 'w', encoding='utf-8') as fout:
+        fout.write(NOTES)
+    out=str(tmp_path/'out')
+    n=split.splitFile(markdown2zim.Markdown2Zim(), filein, out, 2,
+            workers=2, verbose=False)
+    assert n==6
+
+    conv=markdown2zim.Markdown2Zim()
+    for names,text in split.splitNotes(io.StringIO(NOTES), 2, 'export'):
+        path=os.path.join(out, *names)+'.txt'
+        with io.open(path, encoding='utf-8') as fin:
+            assert fin.read()==conv.convert(text)
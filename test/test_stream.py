@@ -0,0 +1,54 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+import os
+import sys
+import io
+import json
+import subprocess
+import markdown2zim
+
+ROOT=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DOCS=['# Doc %d\n\n*em* and [link](http://example.com/%d)\n' %(ii, ii)
+        for ii in range(5)]
+
+def _start(*args):
+    return subprocess.Popen([sys.executable,
+        os.path.join(ROOT, 'markdown2zim.py')]+list(args),
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=ROOT)
+
+
+def test_stdin_stdout():
+    proc=_start('-')
+    out,_=proc.communicate(DOCS[0].encode('utf-8'))
+    assert out.decode('utf-8')==markdown2zim.Markdown2Zim().convert(DOCS[0])
+
+def test_jsonl_frames_flushed_per_document():
+    proc=_start('-', '--frame', 'jsonl')
+    try:
+        for ii,doc in enumerate(DOCS):
+            # wait for each result before sending the next document
+            record={'text': doc, 'id': ii}
+            proc.stdin.write(json.dumps(record).encode('utf-8')+b'\n')
+            proc.stdin.flush()
+            result=json.loads(proc.stdout.readline().decode('utf-8'))
+            assert result=={'id': ii,
+                    'text': markdown2zim.Markdown2Zim().convert(doc)}
+    finally:
+        proc.stdin.close()
+        proc.wait()
+
+def test_nul_frames():
+    proc=_start('-', '--frame', 'nul')
+    out,_=proc.communicate('\0'.join(DOCS).encode('utf-8'))
+    expected=[markdown2zim.Markdown2Zim().convert(dd) for dd in DOCS]
+    assert out.decode('utf-8').split('\0')==expected+['']
+
+def test_nul_frames_across_reads(monkeypatch):
+    from lib import stream
+    # documents and multi-byte characters split over many reads
+    monkeypatch.setattr(stream, 'READ_SIZE', 3)
+    docs=['', 'été', 'a'*20, '', 'b\n']
+    data='\0'.join(docs).encode('utf-8')
+    texts=[text for text,_,_ in stream.readFrames(io.BytesIO(data), 'nul')]
+    assert texts==docs
@@ -0,0 +1,80 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+import sys
+import threading
+import markdown2zim
+import zim2markdown
+from lib.pool import ConverterPool
+
+MD_DOC='''# Doc %d
+
+See [link %d][ref%d] and *em* **strong** `code`.
+
+- item %d
+    - sub item
+
+> quote %d
+
+[ref%d]: http://example.com/%d "Title %d"
+'''
+
+ZIM_DOC='''====== Doc %d ======
+
+//em// **strong** [[Page%d]] and [[http://example.com/%d|link]].
+
+* item %d
+	* sub item
+'''
+
+def _docs(template, n=40):
+    return [template.replace('%d', str(ii)) for ii in range(n)]
+
+
+def _run_threads(func, docs, n_threads=8):
+    results=[None]*len(docs)
+    def work(offset):
+        for ii in range(offset, len(docs), n_threads):
+            results[ii]=func(docs[ii])
+    threads=[threading.Thread(target=work, args=(ii,))
+            for ii in range(n_threads)]
+    # switch threads as often as possible to shake out races
+    interval=sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for tt in threads:
+            tt.start()
+        for tt in threads:
+            tt.join()
+    finally:
+        sys.setswitchinterval(interval)
+    return results
+
+
+def test_shared_instance():
+    for cls, template in ((markdown2zim.Markdown2Zim, MD_DOC),
+            (zim2markdown.Zim2Markdown, ZIM_DOC)):
+        docs=_docs(template)
+        expected=[cls().convert(dd) for dd in docs]
+        shared=cls()
+        for ii in range(5):
+            assert _run_threads(shared.convert, docs)==expected
+
+def test_converter_pool():
+    docs=_docs(MD_DOC)
+    expected=[markdown2zim.Markdown2Zim().convert(dd) for dd in docs]
+    pool=ConverterPool(markdown2zim.Markdown2Zim, size=4)
+
+    assert pool.map(docs, threads=8)==expected
+    assert _run_threads(pool.convert, docs)==expected
+
+def test_converter_pool_file(tmp_path):
+    # links are resolved relative to the page given
+    (tmp_path/'Page').mkdir()
+    (tmp_path/'Page'/'Child.txt').write_text('child')
+    path=str(tmp_path/'Page.txt')
+    text='[[+Child]]\n'
+    expected=zim2markdown.Zim2Markdown().convert(text, path)
+    assert expected!=zim2markdown.Zim2Markdown().convert(text)
+
+    pool=ConverterPool(zim2markdown.Zim2Markdown)
+    assert pool.convert(text, path)==expected